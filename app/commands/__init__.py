@@ -2,3 +2,6 @@
 
 import commands.database
 import commands.system
+import commands.profiles
+import commands.genai
+import commands.geocode
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import asyncio
+import typer
+import system
+from modules import fastpath
+from modules.cassette import CassetteSettings
+from modules.evaluation import evaluate, summarize
+from modules.genai import get_genai_settings
+from modules.scheduler import classified
+
+
+@system.runtime.cli.command(name="genai:fastpath", options_metavar="[options]")
+def fastpath_accuracy(
+    path: str = typer.Argument(None, metavar="[path]", help="Extraction log, fastpath_log of [genai] if omitted."),
+    threshold: float = typer.Option(None, help="Confidence threshold, fastpath_threshold of [genai] if omitted.")
+):
+    """Measure local extractor accuracy against logged LLM extractions."""
+    settings = get_genai_settings()
+    path = (path or settings.fastpath_log or "").replace("{logs}", system.path.logs)
+    threshold = settings.fastpath_threshold if threshold is None else threshold
+    if not path:
+        typer.secho("No extraction log, set fastpath_log in [genai]", fg=typer.colors.RED)
+        raise typer.Exit(1)
+
+    total, served, agreed = 0, 0, 0
+    fields = dict.fromkeys(("travelMode", "entityTypeValues", "excludedEntityTypeValues"), 0)
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            record = json.loads(line)
+            total += 1
+            # extract again, so synonym and cue changes are measured without new LLM calls
+            local = fastpath.extract(record["text"])
+            if local.confidence < threshold:
+                continue
+            served += 1
+            result = fastpath.agreement(local, record["llm"])
+            agreed += all(result.values())
+            for field, equal in result.items():
+                fields[field] += equal
+
+    typer.secho(f"logged: {total}, served locally: {served} ({served / max(total, 1):.1%})")
+    typer.secho(f"exact agreement: {agreed} ({agreed / max(served, 1):.1%})", fg=typer.colors.GREEN)
+    for field, count in fields.items():
+        typer.secho(f"  {field}: {count / max(served, 1):.1%}")
+
+
+@system.runtime.cli.command(name="genai:eval", options_metavar="[options]")
+def evaluation(
+    dataset: str = typer.Argument("app/evals/genai-v1.jsonl", metavar="[dataset]", help="Dataset, relative to root."),
+    concurrency: int = typer.Option(4, help="Cases in flight."),
+    tolerance: float = typer.Option(2.0, help="Geocode distance in km still counted as correct."),
+    record: str = typer.Option(None, help="Record model responses to cassette file."),
+    replay: str = typer.Option(None, help="Serve model responses from cassette file, no network needed."),
+    latency: float = typer.Option(0.0, help="Synthetic latency of replayed calls in seconds."),
+    output: str = typer.Option(None, help="Write JSON report to file."),
+    cache: bool = typer.Option(False, help="Serve repeated requests from extraction and geocode caches.")
+):
+    """Run golden dataset through extraction and geocoding, report accuracy, latency and tokens."""
+    settings = get_genai_settings()
+    if not cache:
+        system.settings.cache = {**getattr(system.settings, "cache", {}), "backend": "none"}
+    if record or replay:
+        settings.cassette = CassetteSettings(
+            mode="record" if record else "replay", path=record or replay, latency=latency)
+
+    with open(os.path.join(system.environment.root, dataset), "r", encoding="utf-8") as handle:
+        cases = [json.loads(line) for line in handle if line.strip()]
+
+    with classified("batch"):
+        results = asyncio.get_event_loop().run_until_complete(evaluate(cases, concurrency, tolerance))
+    for result in results:
+        color = typer.colors.RED if "error" in result else None
+        typer.secho(json.dumps(result, ensure_ascii=False), fg=color)
+    summary = summarize(results)
+    for kind, current in summary.items():
+        typer.secho(f"{kind}: {json.dumps(current)}", fg=typer.colors.GREEN)
+
+    if output:
+        report = {
+            "dataset": dataset,
+            "models": {"extract": settings.extract_model, "geocode": settings.geocode_model},
+            "policies": {name: policy.model_dump() for name, policy in settings.policies.items()},
+            "summary": summary,
+            "cases": results,
+        }
+        with open(output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import asyncio
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+import typer
+import system
+from modules.cache import get_cache_settings
+from modules.genai import get_genai_settings, geocode_with_gemini, geocode_tiers, generic_key, usage_stats
+from modules.scheduler import classified
+
+
+def read_queries(path: str) -> List[Tuple[str, int, List[str]]]:
+    """Rank logged queries by frequency, returns (query, count, locales by frequency).
+
+    Lines are either JSON objects with "query" and optionally "locales" or
+    "locale" (the geocode_log of [genai]), or plain queries, one per line.
+    Queries differing in case and whitespace only are counted together.
+
+    :param path: query log.
+    """
+    counts, forms, locales = Counter(), {}, {}
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line) if line.startswith("{") else {"query": line}
+            query = (record.get("query") or "").strip()
+            if not query:
+                continue
+            key = generic_key(query)
+            counts[key] += 1
+            forms.setdefault(key, Counter())[query] += 1
+            current = record.get("locales") or [record.get("locale") or "en"]
+            locales.setdefault(key, Counter()).update(current)
+    return [
+        (forms[key].most_common(1)[0][0], count, [locale for locale, _ in locales[key].most_common()])
+        for key, count in counts.most_common()
+    ]
+
+
+def model_calls() -> int:
+    return sum(current["calls"] for models in usage_stats.values() for current in models.values())
+
+
+def load_checkpoint(path: str, source: str) -> Set[str]:
+    """Queries already warmed from the same log."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as handle:
+        checkpoint = json.load(handle)
+    return set(checkpoint["done"]) if checkpoint.get("source") == source else set()
+
+
+def save_checkpoint(path: str, source: str, done: Set[str]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+        json.dump({"source": source, "done": sorted(done)}, handle, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+async def warm(
+        queries: List[Tuple[str, int, List[str]]], rate: float, concurrency: int, locales: int,
+        checkpoint: str, source: str, done: Set[str]) -> Dict[str, int]:
+    """Resolve queries through the geocode pipeline, starting at most `rate` per second.
+
+    :param queries: ranked queries, see `read_queries`.
+    :param rate: query budget per second.
+    :param concurrency: queries in flight.
+    :param locales: most frequent locales of a query to warm notes for.
+    :param checkpoint: checkpoint file, updated as queries complete.
+    :param source: query log the checkpoint belongs to.
+    :param done: queries warmed before, updated in place.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"warmed": 0, "failed": 0}
+    started = time.perf_counter()
+
+    async def run(query: str, targets: List[str]):
+        try:
+            result = await asyncio.to_thread(geocode_with_gemini, query, targets[0], targets[1:locales])
+        finally:
+            semaphore.release()
+        if "error" in result:
+            stats["failed"] += 1
+            return
+        stats["warmed"] += 1
+        done.add(generic_key(query))
+        if stats["warmed"] % 50 == 0:
+            save_checkpoint(checkpoint, source, done)
+            elapsed = time.perf_counter() - started
+            typer.secho(f"warmed: {stats['warmed']}/{len(queries)} queries, {stats['warmed'] / elapsed:.1f}/s")
+
+    tasks = []
+    for index, (query, _, targets) in enumerate(queries):
+        # pace starts to the budget, so warm-up leaves Vertex quota to interactive traffic
+        await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(run(query, targets)))
+    await asyncio.gather(*tasks)
+    save_checkpoint(checkpoint, source, done)
+    return stats
+
+
+@system.runtime.cli.command(name="geocode:warm", options_metavar="[options]")
+def warm_cache(
+    path: str = typer.Argument(None, metavar="[path]", help="Query log, geocode_log of [genai] if omitted."),
+    top: int = typer.Option(1000, help="Number of most frequent queries to warm."),
+    rate: float = typer.Option(2.0, help="Queries started per second."),
+    concurrency: int = typer.Option(2, help="Queries in flight."),
+    locales: int = typer.Option(1, help="Most frequent locales per query to warm notes for."),
+    checkpoint: str = typer.Option("{cache}/geocode-warm.json", help="Checkpoint file to resume from."),
+    restart: bool = typer.Option(False, help="Ignore the checkpoint and warm all top queries again.")
+):
+    """Pre-resolve the most frequent logged geocode queries into the persistent cache."""
+    settings = get_genai_settings()
+    path = (path or settings.geocode_log or "").replace("{logs}", system.path.logs)
+    checkpoint = checkpoint.replace("{cache}", system.path.cache)
+    if not path:
+        typer.secho("No query log, set geocode_log in [genai]", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    if get_cache_settings("geocode").backend != "shared":
+        typer.secho("Warm-up needs the persistent cache, set backend = \"shared\" in [cache]", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    # warm-up queries are not traffic, keep them out of the log they are read from
+    settings.geocode_log = None
+
+    source = os.path.abspath(path)
+    done = set() if restart else load_checkpoint(checkpoint, source)
+    ranked = read_queries(path)
+    queries = [item for item in ranked[:top] if generic_key(item[0]) not in done]
+    typer.secho(
+        f"logged: {sum(count for _, count, _ in ranked)} queries, {len(ranked)} distinct, "
+        f"warming {len(queries)} of top {min(top, len(ranked))} ({len(done)} done before)")
+
+    tiers, calls = dict(geocode_tiers), model_calls()
+    started = time.perf_counter()
+    with classified("batch"):
+        stats = asyncio.get_event_loop().run_until_complete(
+            warm(queries, rate, concurrency, max(locales, 1), checkpoint, source, done))
+    elapsed = time.perf_counter() - started
+    typer.secho(f"tiers: {json.dumps({tier: count - tiers[tier] for tier, count in geocode_tiers.items()})}")
+    typer.secho(
+        f"warm-up completed: {stats['warmed']} queries ({stats['failed']} failed) in {elapsed:.1f}s, "
+        f"{stats['warmed'] / max(elapsed, 1e-9):.1f}/s, {model_calls() - calls} model calls", fg=typer.colors.GREEN)
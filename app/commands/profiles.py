@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+import typer
+import system
+from database.gateway.profile import ProfileGateway
+
+
+async def process(steps, title: str):
+    """Drain batch generator and report throughput.
+
+    :param steps: async generator yielding processed items per batch.
+    :param title: operation title.
+    """
+    total, started = 0, time.perf_counter()
+    try:
+        async for count in steps:
+            total += count
+            elapsed = time.perf_counter() - started
+            typer.secho(f"{title}: {total} profiles, {total / elapsed:.0f}/s")
+    finally:
+        for alias in system.runtime.databases.created():
+            await system.runtime.databases.dispose(alias)
+    typer.secho(f"{title} completed: {total} profiles in {time.perf_counter() - started:.1f}s", fg=typer.colors.GREEN)
+
+
+@system.runtime.cli.command(name="profiles:compact", options_metavar="[options]")
+def compact(
+    alias: str = typer.Argument("postgres", metavar="[alias]", help="Database alias."),
+    threshold: int = typer.Option(20, help="Minimal number of deltas after last snapshot."),
+    retention: int = typer.Option(30, help="Days to keep folded deltas for undo and audit."),
+    batch: int = typer.Option(1000, help="Profiles per batch.")
+):
+    """Fold old profile deltas into snapshots."""
+    gateway = ProfileGateway()
+    asyncio.get_event_loop().run_until_complete(
+        process(gateway.compact(alias, threshold, retention, batch), "compacted"))
+
+
+@system.runtime.cli.command(name="profiles:replay", options_metavar="[options]")
+def replay(
+    alias: str = typer.Argument("postgres", metavar="[alias]", help="Database alias."),
+    batch: int = typer.Option(1000, help="Profiles per batch.")
+):
+    """Rebuild stored profiles from snapshots and deltas."""
+    gateway = ProfileGateway()
+    asyncio.get_event_loop().run_until_complete(
+        process(gateway.replay(alias, batch), "replayed"))
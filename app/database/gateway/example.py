@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 from sqlmodel import select
 import system
-from modules.database.sqlmodel import async_session
+from modules.database.sqlmodel import routed_session
+from modules.database.sqlmodel import keyset, pages, stream, upsert, copy
 from modules.database.sqlmodel import sqlmodel_exceptions
 from database.models import postgres
 
@@ -11,14 +12,40 @@ class ExampleGateway:
     databases = system.runtime.databases
 
     @sqlmodel_exceptions
-    async def list(self, alias: str):
-        """Get examples list.
+    async def list(self, alias: str, after: int = None, limit: int = 100):
+        """Get examples page.
 
         :param alias: database alias.
+        :param after: id of the last example of previous page.
+        :param limit: page size.
         """
         if alias == "postgres":
-            async with async_session(self.databases[alias]) as session:
-                return (await session.exec(select(postgres.Example))).all()
+            async with routed_session(alias, "read") as session:
+                return (await session.exec(keyset(
+                    select(postgres.Example), postgres.Example.id, after, limit))).all()
+
+    @sqlmodel_exceptions
+    async def pages(self, alias: str, after: int = None, size: int = 1000):
+        """Iterate over all examples page by page.
+
+        :param alias: database alias.
+        :param after: id to start after.
+        :param size: page size.
+        """
+        if alias == "postgres":
+            async for page in pages(alias, select(postgres.Example), postgres.Example.id, after, size):
+                yield page
+
+    @sqlmodel_exceptions
+    async def stream(self, alias: str, size: int = 1000):
+        """Iterate over all examples with server-side cursor.
+
+        :param alias: database alias.
+        :param size: partition size.
+        """
+        if alias == "postgres":
+            async for partition in stream(alias, select(postgres.Example).order_by(postgres.Example.id), size):
+                yield partition
 
     @sqlmodel_exceptions
     async def read(self, alias: str, example_id: str):
@@ -28,7 +55,7 @@ class ExampleGateway:
         :param example_id: example id.
         """
         if alias == "postgres":
-            async with async_session(self.databases[alias]) as session:
+            async with routed_session(alias, "read") as session:
                 return await session.get(postgres.Example, example_id)
 
     @sqlmodel_exceptions
@@ -40,9 +67,27 @@ class ExampleGateway:
         :param refresh: refresh model, eg record id.
         """
         if alias == "postgres":
-            async with async_session(self.databases[alias]) as session:
+            async with routed_session(alias, "write") as session:
                 session.add(model)
                 await session.commit()
                 if refresh:
                     await session.refresh(model)
                 return model
+
+    @sqlmodel_exceptions
+    async def upsert(self, alias: str, models: list, copy_rows: bool = False):
+        """Create or update many examples in one transaction.
+
+        :param alias: database alias.
+        :param models: example models, existing ids are updated.
+        :param copy_rows: load new rows with COPY, conflicts are not allowed then.
+        """
+        if alias == "postgres":
+            rows = [model.dict(exclude_none=True) for model in models]
+            async with routed_session(alias, "write") as session:
+                if copy_rows:
+                    await copy(session, postgres.Example, rows)
+                else:
+                    await upsert(session, postgres.Example, rows, ["id"])
+                await session.commit()
+            return len(rows)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from typing import Optional, List, Dict, Tuple
+from sqlalchemy import select, update, delete, bindparam, func, or_
+from sqlalchemy.dialects.postgresql import insert
+import system
+from modules.cache import get_cache
+from modules.genai import UserProfile, fold_delta
+from modules.database.sqlmodel import routed_session
+from modules.database.sqlmodel import sqlmodel_exceptions
+from database.models import postgres
+
+
+class ProfileGateway:
+
+    databases = system.runtime.databases
+    cache = get_cache("profiles")
+    # copies of other workers go stale on save, keep them short lived; save checks the version anyway
+    ttl = 30.0
+
+    @sqlmodel_exceptions
+    async def read(self, alias: str, profile_id: str, fresh: bool = False) -> Optional[postgres.Profile]:
+        """Get profile by ID, read-through cache.
+
+        Only rows of the primary are cached, a lagging replica would put
+        an older version back after `save`.
+
+        :param alias: database alias.
+        :param profile_id: profile id.
+        :param fresh: bypass the cache and replicas, eg. before reporting a version conflict.
+        """
+        cached = None if fresh else self.cache.get(profile_id)
+        if cached is not None:
+            return postgres.Profile(**cached)
+        if alias == "postgres":
+            async with routed_session(alias, "write" if fresh else "read") as session:
+                profile = await session.get(postgres.Profile, profile_id)
+            if profile and fresh:
+                self.cache.set(
+                    profile_id, {"id": profile.id, "version": profile.version, "data": profile.data}, self.ttl)
+            return profile
+
+    @sqlmodel_exceptions
+    async def save(self, alias: str, profile_id: str, data: dict, version: int, delta: dict = None) -> Optional[int]:
+        """Store profile state when stored version still matches (optimistic concurrency).
+
+        Delta is appended to the event log in the same transaction, new profiles
+        also get their initial snapshot, the base state may come from client.
+
+        :param alias: database alias.
+        :param profile_id: profile id.
+        :param data: profile state.
+        :param version: version the state is based on, 0 creates new profile.
+        :param delta: delta which produced the state.
+        :return: new version or None on version conflict.
+        """
+        if alias == "postgres":
+            if version == 0:
+                statement = insert(postgres.Profile).values(id=profile_id, version=1, data=data) \
+                    .on_conflict_do_nothing(index_elements=["id"])
+            else:
+                statement = update(postgres.Profile).where(
+                    postgres.Profile.id == profile_id, postgres.Profile.version == version
+                ).values(version=postgres.Profile.version + 1, data=data, updated=func.now())
+            async with routed_session(alias, "write") as session:
+                current = (await session.execute(statement.returning(postgres.Profile.version))).scalar()
+                if current is not None:
+                    session.add(postgres.ProfileEvent(profile_id=profile_id, version=current, delta=delta or {}))
+                    if current == 1:
+                        session.add(postgres.ProfileSnapshot(profile_id=profile_id, version=current, data=data))
+                    await session.commit()
+            if current is None:
+                # someone else was faster, make sure next read sees stored state
+                self.cache.delete(profile_id)
+                return None
+            self.cache.set(profile_id, {"id": profile_id, "version": current, "data": data}, self.ttl)
+            return current
+
+    @sqlmodel_exceptions
+    async def history(self, alias: str, profile_id: str, version: int) -> Optional[postgres.Profile]:
+        """Rebuild profile as it was at given version from snapshots and events.
+
+        :param alias: database alias.
+        :param profile_id: profile id.
+        :param version: profile version.
+        """
+        if alias == "postgres":
+            async with routed_session(alias, "read") as session:
+                states = await materialize(session, [profile_id], version)
+            if profile_id in states and states[profile_id][0] == version:
+                return postgres.Profile(id=profile_id, version=version, data=states[profile_id][1])
+
+    @sqlmodel_exceptions
+    async def compact(self, alias: str, threshold: int = 20, retention: int = 30, batch: int = 1000):
+        """Fold event tails into new snapshots, yields number of compacted profiles per batch.
+
+        :param alias: database alias.
+        :param threshold: minimal number of events after last snapshot.
+        :param retention: days to keep folded events for undo and audit.
+        :param batch: profiles per batch.
+        """
+        if alias == "postgres":
+            snapshot, event = postgres.ProfileSnapshot, postgres.ProfileEvent
+            latest = select(snapshot.profile_id, func.max(snapshot.version).label("version")) \
+                .group_by(snapshot.profile_id).subquery()
+            after = ""
+            while True:
+                async with routed_session(alias, "write") as session:
+                    ids = (await session.execute(
+                        select(event.profile_id)
+                        .outerjoin(latest, latest.c.profile_id == event.profile_id)
+                        .where(event.profile_id > after, event.version > func.coalesce(latest.c.version, 0))
+                        .group_by(event.profile_id).having(func.count() >= threshold)
+                        .order_by(event.profile_id).limit(batch)
+                    )).scalars().all()
+                    if not ids:
+                        return
+                    states = await materialize(session, ids)
+                    await session.execute(insert(snapshot).on_conflict_do_nothing(), [
+                        {"profile_id": profile_id, "version": version, "data": data}
+                        for profile_id, (version, data) in states.items()
+                    ])
+                    folded = select(latest.c.version).where(latest.c.profile_id == event.profile_id) \
+                        .scalar_subquery()
+                    await session.execute(delete(event).where(
+                        event.profile_id.in_(ids), event.version <= folded,
+                        event.created < func.now() - timedelta(days=retention)))
+                    await session.commit()
+                after = ids[-1]
+                yield len(ids)
+
+    @sqlmodel_exceptions
+    async def replay(self, alias: str, batch: int = 1000):
+        """Rebuild stored profiles from snapshots and events, yields number of profiles per batch.
+
+        Used after merge rules or taxonomy change, no LLM calls involved.
+        Every profile is folded again from its earliest snapshot the retained
+        events still cover, the initial one unless `compact` removed events;
+        changes folded into later snapshots before the retention window are
+        kept as they were. Profiles updated concurrently (version moved on)
+        are left untouched.
+
+        :param alias: database alias.
+        :param batch: profiles per batch.
+        """
+        if alias == "postgres":
+            table = postgres.Profile.__table__
+            statement = table.update().where(
+                table.c.id == bindparam("profile_id"), table.c.version == bindparam("profile_version")
+            ).values(data=bindparam("profile_data"))
+            after = ""
+            while True:
+                async with routed_session(alias, "write") as session:
+                    ids = (await session.execute(
+                        select(table.c.id).where(table.c.id > after).order_by(table.c.id).limit(batch)
+                    )).scalars().all()
+                    if not ids:
+                        return
+                    states = await materialize(session, ids, earliest=True)
+                    if states:
+                        await session.execute(statement, [
+                            {"profile_id": profile_id, "profile_version": version, "profile_data": data}
+                            for profile_id, (version, data) in states.items()
+                        ])
+                    await session.commit()
+                for profile_id in ids:
+                    self.cache.delete(profile_id)
+                after = ids[-1]
+                yield len(ids)
+
+
+async def materialize(
+        session, ids: List[str], version: int = None, earliest: bool = False
+) -> Dict[str, Tuple[int, dict]]:
+    """Materialize profiles from latest snapshot plus the tail of deltas, two queries per batch.
+
+    :param session: async session.
+    :param ids: profile ids.
+    :param version: materialize as of this version, latest if omitted.
+    :param earliest: start from the earliest snapshot the retained deltas follow up on instead.
+    :return: profile id to (version, state) mapping.
+    """
+    snapshot, event = postgres.ProfileSnapshot, postgres.ProfileEvent
+    snapshots = select(snapshot.profile_id, snapshot.version, snapshot.data).where(snapshot.profile_id.in_(ids))
+    events = select(event.profile_id, event.version, event.delta).where(event.profile_id.in_(ids))
+    if version is not None:
+        snapshots = snapshots.where(snapshot.version <= version)
+        events = events.where(event.version <= version)
+    if earliest:
+        # retained deltas are a suffix of the log, the initial snapshot already holds the first one
+        first = select(event.profile_id, func.min(event.version).label("version")) \
+            .where(event.profile_id.in_(ids)).group_by(event.profile_id).subquery()
+        snapshots = snapshots.outerjoin(first, first.c.profile_id == snapshot.profile_id).where(
+            or_(first.c.version.is_(None), snapshot.version <= func.greatest(first.c.version - 1, 1)))
+    snapshots = snapshots.distinct(snapshot.profile_id) \
+        .order_by(snapshot.profile_id, snapshot.version.desc()).subquery()
+    events = events.outerjoin(snapshots, snapshots.c.profile_id == event.profile_id) \
+        .where(event.version > func.coalesce(snapshots.c.version, 0)).order_by(event.profile_id, event.version)
+
+    states = {row.profile_id: (row.version, row.data) for row in (await session.execute(select(snapshots))).all()}
+    empty = UserProfile().model_dump()
+    for profile_id, current, delta in (await session.execute(events)).all():
+        states[profile_id] = (current, fold_delta(states.get(profile_id, (0, empty))[1], delta))
+    return states
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 from database.models.postgres.example import Example
+from database.models.postgres.profile import Profile, ProfileEvent, ProfileSnapshot
 
 __all__ = [
-    "Example"
+    "Example",
+    "Profile",
+    "ProfileEvent",
+    "ProfileSnapshot"
 ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Column, DateTime, BigInteger, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import SQLModel, Field
+
+
+class Profile(SQLModel, table=True):
+
+    __tablename__ = "profiles"
+
+    id: str = Field(primary_key=True, nullable=False, max_length=64,
+                    description="Profile ID", schema_extra={"example": "3f2c1f0e6f3b4d0c9a1e"})
+    version: int = Field(1, nullable=False, description="Profile version", schema_extra={"example": 3})
+    data: dict = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False),
+                       description="Profile state")
+    updated: Optional[datetime] = Field(
+        None, sa_column=Column(DateTime(timezone=True), nullable=False, server_default=func.now()),
+        description="Last update time")
+
+
+class ProfileEvent(SQLModel, table=True):
+
+    __tablename__ = "profile_events"
+    __table_args__ = (Index("profile_events_profile_version", "profile_id", "version", unique=True),)
+
+    id: Optional[int] = Field(None, sa_column=Column(BigInteger, primary_key=True, autoincrement=True),
+                              description="Event ID")
+    profile_id: str = Field(..., nullable=False, max_length=64, description="Profile ID")
+    version: int = Field(..., nullable=False, description="Profile version produced by delta")
+    delta: dict = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False),
+                        description="Extracted profile delta")
+    created: Optional[datetime] = Field(
+        None, sa_column=Column(DateTime(timezone=True), nullable=False, server_default=func.now()),
+        description="Event time")
+
+
+class ProfileSnapshot(SQLModel, table=True):
+
+    __tablename__ = "profile_snapshots"
+
+    profile_id: str = Field(primary_key=True, nullable=False, max_length=64, description="Profile ID")
+    version: int = Field(primary_key=True, nullable=False, description="Profile version")
+    data: dict = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False),
+                       description="Profile state")
+    created: Optional[datetime] = Field(
+        None, sa_column=Column(DateTime(timezone=True), nullable=False, server_default=func.now()),
+        description="Snapshot time")
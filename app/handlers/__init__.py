@@ -6,7 +6,7 @@ import handlers.security
 import handlers.example.handlers
 import handlers.databases.handlers
 import handlers.health
-import handlers.profile
+import handlers.hackathon
 
 export = [
     handlers.base,
@@ -14,7 +14,7 @@ export = [
     handlers.example.handlers,
     handlers.databases.handlers,
     handlers.health,
-    handlers.profile,
+    handlers.hackathon,
 ]
 
 
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, Depends, Response, Path
+import json
+from fastapi import APIRouter, Depends, Response, Path, Query
 from fastapi import HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+import system
 from modules.system.fastapi import headers, responses
 from modules.database.module import DatabaseException
 from database.gateway import example
@@ -19,14 +21,35 @@ router.app = "api"
     summary="Postgres: Examples list",
     response_model=schemas.PostgresListResponse
 )
-async def postgres_list():
-    """Get examples list from Postgres database"""
+async def postgres_list(
+    after: int = Query(None, description="Start after example ID"),
+    size: int = Query(1000, ge=1, le=10000, description="Page size used to fetch from database")
+):
+    """Get examples list from Postgres database, streamed page by page, later failures are reported in error"""
     gateway = example.ExampleGateway()
+    pages = gateway.pages("postgres", after, size)
     try:
-        result = await gateway.list("postgres")
+        page = await anext(pages, [])
     except DatabaseException as ex:
         return JSONResponse({"code": 201, "detail": str(ex)}, status_code=550)
-    return {"examples": result}
+
+    async def content(page):
+        separator = ""
+        yield '{"examples":['
+        try:
+            while page:
+                for item in page:
+                    yield separator + item.model_dump_json()
+                    separator = ","
+                page = await anext(pages, [])
+        except Exception as ex:  # pylint: disable = W0718
+            # status is already sent, close the document and report the failure in it
+            system.logger.exception(ex)
+            yield '],"error":' + json.dumps({"code": 201, "detail": str(ex)}) + "}"
+            return
+        yield "]}"
+
+    return StreamingResponse(content(page), media_type="application/json")
 
 
 @router.get(
@@ -61,3 +84,18 @@ async def postgres_create(response: Response, model: schemas.postgres.Example):
     response.headers["Location"] = router.url_path_for(
         "databases:postgres:read", example_id=result.id)
     return result
+
+
+@router.put(
+    "/postgres", name="databases:postgres:upsert",
+    summary="Postgres: Create or update examples in bulk",
+    response_model=schemas.PostgresUpsertResponse
+)
+async def postgres_upsert(data: schemas.PostgresUpsertRequest):
+    """Create or update many examples in Postgres database at once"""
+    gateway = example.ExampleGateway()
+    try:
+        count = await gateway.upsert("postgres", data.examples, data.copy_rows)
+    except DatabaseException as ex:
+        return JSONResponse({"code": 201, "detail": str(ex)}, status_code=550)
+    return {"count": count}
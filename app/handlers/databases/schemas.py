@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=R0903
-from typing import List
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
 from database.gateway.example import postgres
 
 
 class PostgresListResponse(BaseModel):
     examples: List[postgres.Example]
+    error: Optional[Dict[str, Any]] = Field(None, description="Failure after streaming started, examples are incomplete")
+
+
+class PostgresUpsertRequest(BaseModel):
+    examples: List[postgres.Example] = Field(..., max_length=10000)
+    copy_rows: bool = Field(False, alias="copy", description="Load with COPY, new examples only")
+
+
+class PostgresUpsertResponse(BaseModel):
+    count: int = Field(..., example=3)
@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 
-from typing import Dict, Any, Optional
+import asyncio
+import json
+from typing import Dict, Any, List, Optional
 from fastapi import HTTPException
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 from modules.genai import extract_full_profile, geocode_with_gemini, UserProfile, update_profile_from_text
+from modules.genai import merge_profile_from_text, stream_notes_from_profile
+from modules.genai import GeocodeResponse
+from modules.system.fastapi import DefaultResponse, validated
+from modules.database.module import DatabaseException
+from database.gateway.profile import ProfileGateway
 from enum import Enum
 
+PROFILES_ALIAS = "postgres"
+
 class LLMBackend(str, Enum):
     GEMINI = "gemini"
     OPENAI = "openai"
@@ -26,22 +36,27 @@ class ProfileExtractRequest(BaseModel):
     returnValues: bool = False
     backend: LLMBackend = LLMBackend.GEMINI
     currentState: Optional[UserProfile] = None
+    profileId: Optional[str] = Field(None, min_length=1, max_length=64)
+    version: Optional[int] = Field(None, ge=0)
 
 class ProfileExtractResponse(BaseModel):
+    profile: Optional[UserProfile] = None
+    profileId: Optional[str] = None
+    version: Optional[int] = None
+    changes: Optional[Dict[str, Any]] = None
+    source: Optional[str] = Field(None, description="Extraction path: local, semantic, llm or none for empty text")
+
+class ProfileResponse(BaseModel):
+    profileId: str
+    version: int
     profile: UserProfile
 
 class GeocodeRequest(BaseModel):
     query: str
     locale: str = "en"
+    locales: List[str] = Field(default_factory=list, description="Extra locales of localizedNotes")
+    candidates: int = Field(0, ge=0, description="Return up to this many ranked locations, capped by [genai]")
 
-class GeocodeResponse(BaseModel):
-    standardizedQuery: str = ""
-    resolvedName: str = ""
-    countryCode: str | None = None
-    lat: float | None = None
-    lon: float | None = None
-    sourceUrls: list[str] = []
-    notes: str = ""
 
 
 @router.post(
@@ -50,16 +65,167 @@ class GeocodeResponse(BaseModel):
     summary="Update user profile from free text",
 )
 async def extract_profile(payload: ProfileExtractRequest) -> ProfileExtractResponse:
-    state = payload.currentState or UserProfile()
-
-    new_state, _ = update_profile_from_text(
+    if payload.profileId is None:
+        state = payload.currentState or UserProfile()
+
+        # worker thread keeps the loop free, so concurrent extractions can be batched
+        new_state, delta = await asyncio.to_thread(
+            update_profile_from_text,
+            text=payload.text,
+            locale=payload.locale,
+            state=state,
+            return_values=payload.returnValues,
+        )
+
+        return validated(ProfileExtractResponse(profile=new_state, source=delta.get("source")))
+
+    # server-side profile: unknown id starts a new profile, the client gets changed fields only
+    gateway = ProfileGateway()
+    try:
+        stored = await load_profile(gateway, payload)
+    except DatabaseException as ex:
+        return JSONResponse({"code": 201, "detail": str(ex)}, status_code=550)
+
+    state = UserProfile(**stored.data) if stored else (payload.currentState or UserProfile())
+    before = state.model_dump()
+    new_state, delta = await asyncio.to_thread(
+        update_profile_from_text,
         text=payload.text,
         locale=payload.locale,
         state=state,
-        return_values=payload.returnValues,
+        return_values=True,
+    )
+    try:
+        return validated(await store_profile(gateway, payload, stored, before, new_state, delta))
+    except DatabaseException as ex:
+        return JSONResponse({"code": 201, "detail": str(ex)}, status_code=550)
+
+
+async def load_profile(gateway: ProfileGateway, payload: ProfileExtractRequest):
+    """Read stored profile of the request and check the expected version, the database has the last word."""
+    stored = await gateway.read(PROFILES_ALIAS, payload.profileId)
+    version = stored.version if stored else 0
+    if payload.version is not None and payload.version != version:
+        stored = await gateway.read(PROFILES_ALIAS, payload.profileId, fresh=True)
+        version = stored.version if stored else 0
+    if payload.version is not None and payload.version != version:
+        raise HTTPException(status_code=409, detail=f"Profile version conflict, stored version is {version}")
+    return stored
+
+
+async def store_profile(
+    gateway: ProfileGateway,
+    payload: ProfileExtractRequest,
+    stored,
+    before: dict,
+    new_state: UserProfile,
+    delta: dict,
+) -> ProfileExtractResponse:
+    """Save updated profile when anything changed and build response with changed fields only."""
+    version = stored.version if stored else 0
+    after = new_state.model_dump()
+    changes = {key: value for key, value in after.items() if before.get(key) != value}
+
+    if changes or not stored:
+        # generated notes go into the logged delta, so replay needs no LLM calls; the extraction path is no delta
+        logged = {key: value for key, value in delta.items() if key != "source"}
+        version = await gateway.save(
+            PROFILES_ALIAS, payload.profileId, after, version, {**logged, "notes": new_state.notes})
+        if version is None:
+            raise HTTPException(status_code=409, detail="Profile was updated concurrently")
+
+    if not payload.returnValues:
+        changes.pop("entityTypeValues", None)
+        changes.pop("excludedEntityTypeValues", None)
+
+    return ProfileExtractResponse(
+        profileId=payload.profileId, version=version, changes=changes, source=delta.get("source"))
+
+
+def sse(event: str, data: Any) -> str:
+    """Encode one server-sent event, data is JSON so newlines in tokens are safe."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+@router.post(
+    "/notes/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "Server-sent events"}},
+    summary="Update user profile from free text, stream notes as they are generated",
+)
+async def stream_profile_notes(payload: ProfileExtractRequest):
+    """
+    Same update as `/profile/extract`, but notes are streamed as server-sent events.
+
+    Every `token` event carries a chunk of notes text as soon as the model
+    produces it, the last `profile` event carries the response `/profile/extract`
+    would return. Failures after the stream started are sent as an `error` event.
+    """
+    gateway = stored = None
+    if payload.profileId is not None:
+        gateway = ProfileGateway()
+        try:
+            stored = await load_profile(gateway, payload)
+        except DatabaseException as ex:
+            return JSONResponse({"code": 201, "detail": str(ex)}, status_code=550)
+        state = UserProfile(**stored.data) if stored else (payload.currentState or UserProfile())
+    else:
+        state = payload.currentState or UserProfile()
+
+    before = state.model_dump()
+    new_state, delta = await asyncio.to_thread(
+        merge_profile_from_text,
+        payload.text,
+        payload.locale,
+        state,
+        payload.returnValues or gateway is not None,
     )
 
-    return ProfileExtractResponse(profile=new_state)
+    async def events():
+        chunks = []
+        async for chunk in stream_notes_from_profile(new_state, payload.locale):
+            chunks.append(chunk)
+            yield sse("token", chunk)
+        new_state.notes = "".join(chunks).strip()
+
+        if gateway is None:
+            response = ProfileExtractResponse(profile=new_state, source=delta.get("source"))
+            yield sse("profile", response.model_dump(mode="json"))
+            return
+        try:
+            response = await store_profile(gateway, payload, stored, before, new_state, delta)
+        except DatabaseException as ex:
+            yield sse("error", {"code": 201, "detail": str(ex), "status": 550})
+        except HTTPException as ex:
+            yield sse("error", {"detail": ex.detail, "status": ex.status_code})
+        else:
+            yield sse("profile", response.model_dump(mode="json"))
+
+    # proxies must not buffer the stream, otherwise tokens arrive all at once
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get(
+    "/{profileId}",
+    response_model=ProfileResponse,
+    summary="Get stored user profile",
+)
+async def read_profile(
+    profileId: str,
+    version: Optional[int] = Query(None, ge=1, description="Historical version, latest if omitted"),
+) -> ProfileResponse:
+    gateway = ProfileGateway()
+    try:
+        if version is None:
+            stored = await gateway.read(PROFILES_ALIAS, profileId)
+        else:
+            stored = await gateway.history(PROFILES_ALIAS, profileId, version)
+    except DatabaseException as ex:
+        return JSONResponse({"code": 201, "detail": str(ex)}, status_code=550)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return validated(ProfileResponse(profileId=stored.id, version=stored.version, profile=UserProfile(**stored.data)))
 
 
 @router.post(
@@ -68,18 +234,13 @@ async def extract_profile(payload: ProfileExtractRequest) -> ProfileExtractRespo
     summary="Geocode place with Gemini",
 )
 async def geocode_place(payload: GeocodeRequest) -> GeocodeResponse:
-    raw = geocode_with_gemini(payload.query, locale=payload.locale)
-
+    # worker thread keeps the loop free to notice disconnects and deadlines while Gemini answers
+    raw = await asyncio.to_thread(
+        geocode_with_gemini,
+        payload.query, locale=payload.locale, targets=payload.locales, candidates=payload.candidates)
 
     if isinstance(raw, dict) and "error" in raw:
         raise HTTPException(status_code=400, detail=raw["error"])
 
-    return GeocodeResponse(
-        standardizedQuery=raw.get("standardizedQuery", ""),
-        resolvedName=raw.get("resolvedName", ""),
-        countryCode=raw.get("countryCode"),
-        lat=raw.get("lat"),
-        lon=raw.get("lon"),
-        sourceUrls=raw.get("sourceUrls", []),
-        notes=raw.get("notes"),
-    )
+    # response_model is bypassed, dump through it so internal fields of cached results never leak
+    return DefaultResponse(GeocodeResponse.model_validate(raw).model_dump(mode="json"))
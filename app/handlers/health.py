@@ -1,4 +1,13 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+import system
+import modules.genai as genai
+import modules.database.module as database
+from modules.database.sqlmodel import pool_stats
+from modules.cache import get_refreshing_cache
+from modules import deadline
+from modules.admission import get_admission
 
 router = APIRouter(
     prefix="/health",
@@ -10,3 +19,62 @@ router.app = "api"
 @router.get("", summary="Health check")
 async def health():
     return {"status": "ok"}
+
+
+@router.get("/ready", summary="Readiness check")
+async def ready():
+    if not genai.readiness["ready"]:
+        return JSONResponse(
+            {"status": "warming", "detail": genai.readiness["error"]},
+            status_code=503,
+        )
+    if database.registry and not database.readiness["ready"]:
+        return JSONResponse({"status": "warming", "detail": "databases"}, status_code=503)
+    return {"status": "ready", "refreshed": genai.readiness["refreshed"]}
+
+
+@router.get("/databases", summary="Database pools statistics")
+async def databases():
+    return {
+        alias: {
+            "warmed": database.readiness["warmed"].get(alias),
+            **pool_stats(system.runtime.databases[alias]),
+        }
+        for alias in system.runtime.databases.created()
+    }
+
+
+@router.get("/genai", summary="LLM token and latency statistics per generation policy")
+async def genai_usage():
+    return {
+        "policies": {
+            name: {
+                model: {**stats, "avgSeconds": stats["seconds"] / stats["calls"] if stats["calls"] else 0.0}
+                for model, stats in models.items()
+            }
+            for name, models in genai.usage_stats.items()
+        },
+        # final answers per geocode tier, grounded escalations are the costly ones
+        "geocodeTiers": genai.geocode_tiers,
+        # stale-while-revalidate of geocode results: stale serves, background refreshes
+        "geocodeCache": get_refreshing_cache("geocode").report(),
+        # queue time of upstream calls per traffic class
+        "scheduler": genai.get_scheduler().report(),
+    }
+
+
+@router.get("/semantic", summary="Semantic extraction cache statistics")
+async def semantic_cache():
+    cache = genai.get_semantic_cache()
+    return cache.report() if cache else {"enabled": False}
+
+
+@router.get("/deadlines", summary="Request deadline and cancellation statistics")
+async def deadlines():
+    # skipped calls and cancelled requests are upstream work nobody would have read
+    return deadline.stats
+
+
+@router.get("/admission", summary="Queue and load shedding statistics of LLM-bound requests")
+async def admission():
+    return get_admission().report()
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 from middlewares.metadata import MetadataMiddleware
+from middlewares.deadline import DeadlineMiddleware, deadline_exceeded
+from middlewares.admission import AdmissionMiddleware
 
 __all__ = [
-    "MetadataMiddleware"
+    "MetadataMiddleware",
+    "DeadlineMiddleware",
+    "deadline_exceeded",
+    "AdmissionMiddleware"
 ]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import json
+import asyncio
+import time
+from modules import deadline
+from modules.admission import Overloaded, get_admission
+from modules.deadline import get_deadline_settings
+from modules.genai import geocode_cached
+
+
+class AdmissionMiddleware:
+    """
+    Admission middleware, will queue LLM-bound requests and shed them early under overload.
+
+    Requests whose estimated queue wait exceeds their share of the request
+    deadline are answered with 503 and Retry-After before any work is done,
+    see `modules.admission.Admission`. It runs inside `DeadlineMiddleware`,
+    so time spent queued counts against the deadline and a request cut
+    short while queued gives its place up.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.admission = get_admission()
+        self.settings = self.admission.settings
+        self.deadlines = get_deadline_settings()
+
+    async def __call__(self, scope, receive, send):
+        route = self.admission.route(scope["path"]) if scope["type"] == "http" and self.settings.enabled else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        cacheable = any(scope["path"].startswith(prefix) for prefix in self.settings.cached)
+        if cacheable and self.admission.estimate() > 0:
+            # answered from cache without upstream calls, queueing it would only add latency
+            chunks, more = [], True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunks.append(message.get("body", b""))
+                more = message.get("more_body", False)
+            body = b"".join(chunks)
+            receive = self.replay(body, receive)
+            if await self.cached(body):
+                self.admission.route_stats(route)["bypassed"] += 1
+                await self.app(scope, receive, send)
+                return
+
+        current = deadline.current.get()
+        remaining = current.remaining() if current else self.deadlines.maximum
+        try:
+            self.admission.check(route, self.settings.budget * remaining)
+        except Overloaded as e:
+            await self.reject(send, e.retry)
+            return
+
+        await self.admission.acquire(route)
+        started, elapsed = time.monotonic(), None
+        try:
+            await self.app(scope, receive, send)
+            elapsed = time.monotonic() - started
+        finally:
+            self.admission.release(route, elapsed)
+
+    @staticmethod
+    def replay(body: bytes, receive):
+        """Receive giving the buffered body first, then passing through."""
+        replayed = False
+
+        async def replayed_receive():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        return replayed_receive
+
+    @staticmethod
+    async def cached(body: bytes) -> bool:
+        try:
+            payload = json.loads(body or b"{}")
+            return await asyncio.to_thread(
+                geocode_cached, payload["query"], payload.get("locale") or "en",
+                list(payload.get("locales") or []), int(payload.get("candidates") or 0))
+        except Exception:  # noqa: BLE001
+            # malformed requests are left to the handler
+            return False
+
+    @staticmethod
+    async def reject(send, retry: int):
+        content = json.dumps({"detail": "Service overloaded, retry later"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(content)).encode()),
+                (b"retry-after", str(retry).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": content})
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import json
+import asyncio
+import time
+from contextlib import suppress
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from modules import deadline
+from modules.deadline import Deadline, DeadlineExceeded, get_deadline_settings
+
+
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded) -> JSONResponse:  # pylint: disable=W0613
+    """
+    Answer 504 to a deadline exceeded inside a mounted subapp.
+
+    Subapps turn unhandled exceptions into 500 responses of their own before
+    `DeadlineMiddleware` sees them, register this handler on every subapp.
+    """
+    deadline.stats["timeouts"] += 1
+    return JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+
+
+class DeadlineMiddleware:
+    """
+    Deadline middleware, will bound every request by its deadline and cancel it on client disconnect.
+
+    The request body is read upfront, so `receive` is free to watch for
+    `http.disconnect` while the handler runs. When the client goes away the
+    handler task is cancelled; when the deadline passes it is cancelled too
+    and answered with 504 unless the response already started. Worker
+    threads see the cancellation through `modules.deadline.current` and skip
+    their remaining upstream calls.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.settings = get_deadline_settings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = self.settings.header.lower().encode("latin-1")
+        value = next((item.decode("latin-1") for key, item in scope["headers"] if key == header), None)
+        seconds = deadline.budget(self.settings, scope["path"], value)
+        if seconds is None:
+            await self.app(scope, receive, send)
+            return
+        deadline.stats["requests"] += 1
+
+        body, more = [], True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                deadline.stats["disconnects"] += 1
+                return
+            body.append(message.get("body", b""))
+            more = message.get("more_body", False)
+
+        gone = asyncio.Event()
+        replayed = started = finished = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": b"".join(body), "more_body": False}
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def tracked(message):
+            nonlocal started, finished
+            started = started or message["type"] == "http.response.start"
+            finished = finished or message["type"] == "http.response.body" and not message.get("more_body", False)
+            await send(message)
+
+        async def watch():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            gone.set()
+
+        current = Deadline(time.monotonic() + seconds)
+        token = deadline.current.set(current)
+        # tasks copy the context, so the handler and its worker threads see the deadline
+        task = asyncio.create_task(self.app(scope, replay, tracked))
+        watcher = asyncio.create_task(watch())
+        deadline.current.reset(token)
+        try:
+            await asyncio.wait({task, watcher}, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+
+        # a sent response may still run background tasks, those are not wasted
+        if task.done() or finished:
+            try:
+                await task
+            except DeadlineExceeded:
+                deadline.stats["timeouts"] += 1
+                await self.timeout(send, started, finished)
+            return
+
+        current.cancelled.set()
+        task.cancel()
+        with suppress(asyncio.CancelledError, DeadlineExceeded):
+            await task
+        deadline.stats["cancelled"] += 1
+        if gone.is_set():
+            deadline.stats["disconnects"] += 1
+            return
+        deadline.stats["timeouts"] += 1
+        await self.timeout(send, started, finished)
+
+    @staticmethod
+    async def timeout(send, started: bool, finished: bool):
+        """Answer 504, or just end a response that already started, eg. a stream."""
+        if finished:
+            return
+        if started:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        content = json.dumps({"detail": "Request deadline exceeded"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(content)).encode())],
+        })
+        await send({"type": "http.response.body", "body": content})
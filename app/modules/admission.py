@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import asyncio
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional
+from pydantic import BaseModel, Field
+import system
+
+
+class AdmissionSettings(BaseModel, extra="allow"):
+    """
+    Admission of LLM-bound requests, configured in [admission].
+
+    At most `concurrency` requests to `routes` run at once, the rest wait in
+    one FIFO queue. A request whose estimated queue wait exceeds `budget`
+    share of its deadline is rejected at once with 503 and a Retry-After of
+    the time the queue needs to drain below the budget, bounded by
+    `retry_min` and `retry_max`. Requests to `always`, and requests to
+    `cached` the geocode cache answers, skip the queue.
+    """
+    enabled: bool = True
+    concurrency: int = 32
+    budget: float = 0.5
+    routes: List[str] = Field(default_factory=lambda: [
+        "/api/profile/extract", "/api/profile/notes/stream", "/api/profile/geocode"])
+    always: List[str] = Field(default_factory=lambda: ["/api/health"])
+    cached: List[str] = Field(default_factory=lambda: ["/api/profile/geocode"])
+    service: float = 2.0
+    smoothing: float = 0.1
+    retry_min: int = 1
+    retry_max: int = 60
+
+
+def get_admission_settings() -> AdmissionSettings:
+    return AdmissionSettings(**getattr(system.settings, "admission", {}))
+
+
+@lru_cache()
+def get_admission() -> "Admission":
+    return Admission(get_admission_settings())
+
+
+class Overloaded(Exception):
+    """Request rejected, its estimated queue wait exceeds the budget.
+
+    :param retry: seconds to wait before retrying.
+    """
+    def __init__(self, retry: int):
+        super().__init__(f"overloaded, retry after {retry}s")
+        self.retry = retry
+
+
+class Admission:
+    """
+    Queue of LLM-bound requests of a worker with early rejection.
+
+    The wait of a new request is estimated as the requests ahead of it
+    divided by `concurrency` times the mean service time, an exponentially
+    weighted average over completed requests. Rejecting up front keeps
+    accepted requests within their deadlines instead of letting every
+    request in the queue time out during a spike.
+
+    :param settings: admission settings.
+    """
+    def __init__(self, settings: AdmissionSettings):
+        self.settings = settings
+        self.inflight = 0
+        self.queue: Deque[asyncio.Future] = deque()
+        self.service = settings.service
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def route(self, path: str) -> Optional[str]:
+        """Queued route prefix of path, None for requests admitted at once."""
+        if any(path.startswith(prefix) for prefix in self.settings.always):
+            return None
+        return next((prefix for prefix in self.settings.routes if path.startswith(prefix)), None)
+
+    def estimate(self) -> float:
+        """Seconds a request arriving now would wait for its turn."""
+        ahead = self.inflight + len(self.queue) - self.settings.concurrency + 1
+        if ahead <= 0:
+            return 0.0
+        return math.ceil(ahead / self.settings.concurrency) * self.service
+
+    def route_stats(self, route: str) -> Dict[str, Any]:
+        return self.stats.setdefault(route, {
+            "admitted": 0, "rejected": 0, "bypassed": 0, "completed": 0, "inflight": 0, "waiting": 0,
+            "waitAvg": 0.0, "waitMax": 0.0, "serviceAvg": 0.0})
+
+    def smooth(self, average: float, value: float, count: int) -> float:
+        """Exponentially weighted average, the first sample taken as is."""
+        return value if count <= 1 else average + self.settings.smoothing * (value - average)
+
+    def check(self, route: str, budget: float):
+        """Raise Overloaded when a request of route would wait longer than its budget.
+
+        :param route: queued route prefix.
+        :param budget: seconds the request may wait, share of its deadline.
+        """
+        wait = self.estimate()
+        if wait <= budget:
+            return
+        self.route_stats(route)["rejected"] += 1
+        retry = min(max(math.ceil(wait - budget), self.settings.retry_min), self.settings.retry_max)
+        raise Overloaded(retry)
+
+    async def acquire(self, route: str) -> float:
+        """Wait for a slot, returns the seconds waited; cancellation gives the place up.
+
+        :param route: queued route prefix.
+        """
+        stats = self.route_stats(route)
+        started = time.monotonic()
+        if self.inflight < self.settings.concurrency and not self.queue:
+            self.inflight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.queue.append(future)
+            stats["waiting"] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    if future in self.queue:
+                        self.queue.remove(future)
+                else:
+                    # the slot was handed over meanwhile, pass it on
+                    self.inflight -= 1
+                    self.wake()
+                raise
+            finally:
+                stats["waiting"] -= 1
+        waited = time.monotonic() - started
+        stats["admitted"] += 1
+        stats["inflight"] += 1
+        stats["waitAvg"] = self.smooth(stats["waitAvg"], waited, stats["admitted"])
+        stats["waitMax"] = max(stats["waitMax"], waited)
+        return waited
+
+    def release(self, route: str, elapsed: Optional[float]):
+        """Free the slot of an admitted request and wake the next one.
+
+        :param route: queued route prefix.
+        :param elapsed: seconds the request held its slot, None when it did not complete.
+        """
+        self.inflight -= 1
+        stats = self.route_stats(route)
+        stats["inflight"] -= 1
+        if elapsed is not None:
+            stats["completed"] += 1
+            stats["serviceAvg"] = self.smooth(stats["serviceAvg"], elapsed, stats["completed"])
+            self.service += self.settings.smoothing * (elapsed - self.service)
+        self.wake()
+
+    def wake(self):
+        """Hand free slots over to queued requests."""
+        while self.queue and self.inflight < self.settings.concurrency:
+            future = self.queue.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.settings.concurrency,
+            "inflight": self.inflight,
+            "waiting": len(self.queue),
+            "serviceAvg": self.service,
+            "estimatedWait": self.estimate(),
+            "routes": self.stats,
+        }
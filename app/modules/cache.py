@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+from pydantic import BaseModel
+import system
+from modules import deadline
+from modules.deadline import DeadlineExceeded
+from modules.scheduler import classified
+
+
+class CacheSettings(BaseModel, extra="allow"):
+    backend: str = "memory"
+    path: str = "{cache}/shared.sqlite"
+    ttl: float = 86400.0
+    size: int = 100000
+    timeout: float = 5.0
+    # expired entries are kept that many seconds longer for stale-while-revalidate
+    stale: float = 86400.0
+    # ttl of every entry is randomized by up to that share, so entries stored together expire apart
+    jitter: float = 0.0
+    # refresh hot entries ahead of expiry during that last share of ttl, see RefreshingCache
+    refresh_ahead: float = 0.1
+    refresh_hits: int = 3
+    refresh_concurrency: int = 2
+    refresh_queue: int = 256
+
+
+def expiry(ttl: float, jitter: float) -> float:
+    """Expiration timestamp of an entry stored now, ttl randomized by up to `jitter` share."""
+    if jitter:
+        ttl *= 1 + random.uniform(-jitter, jitter)
+    return time.time() + ttl
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry TTL.
+
+    :param namespace: cache namespace.
+    :param ttl: default time to live in seconds.
+    :param size: maximum number of entries.
+    :param stale: seconds expired entries are still returned by `peek`.
+    :param jitter: share of ttl randomizing expiration.
+    """
+    def __init__(self, namespace: str, ttl: float, size: int, stale: float = 0.0, jitter: float = 0.0):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.size = size
+        self.stale = stale
+        self.jitter = jitter
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get value by key, expired entries are treated as missing.
+
+        :param key: cache key.
+        :param default: value returned on miss.
+        """
+        entry = self.peek(key)
+        if entry is None or entry[1] <= time.time():
+            return default
+        return entry[0]
+
+    def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Get (value, expires) by key, expired entries included within the stale window.
+
+        :param key: cache key.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] + self.stale <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store value.
+
+        :param key: cache key.
+        :param value: value, must be JSON serializable to stay backend agnostic.
+        :param ttl: time to live in seconds, namespace default if omitted.
+        """
+        with self.lock:
+            self.entries[key] = (value, expiry(ttl or self.ttl, self.jitter))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        """Remove value by key."""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """Remove all values of the namespace."""
+        with self.lock:
+            self.entries.clear()
+
+
+class SharedCache:
+    """Cross-process cache backed by a local SQLite database in WAL mode.
+
+    Every uvicorn worker on the node opens the same file, so a value stored
+    by one worker is a hit for all others. Readers never block writers in
+    WAL mode and lookups are a single primary key probe.
+
+    :param namespace: cache namespace.
+    :param ttl: default time to live in seconds.
+    :param size: maximum number of entries per namespace.
+    :param path: database file location.
+    :param timeout: busy timeout in seconds.
+    :param stale: seconds expired entries are still returned by `peek`.
+    :param jitter: share of ttl randomizing expiration.
+    """
+
+    # purge expired and excess entries roughly once per that many writes
+    purge_every = 1000
+
+    def __init__(
+            self, namespace: str, ttl: float, size: int, path: str, timeout: float,
+            stale: float = 0.0, jitter: float = 0.0):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.size = size
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Open connection lazily and once per process, connections must not cross fork."""
+        if self.connection is None or self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (namespace, expires)")
+            self.connection, self.pid = connection, os.getpid()
+        return self.connection
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get value by key, expired entries are treated as missing.
+
+        :param key: cache key.
+        :param default: value returned on miss.
+        """
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+                (self.namespace, key, time.time())).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Get (value, expires) by key, expired entries included within the stale window.
+
+        :param key: cache key.
+        """
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT value, expires FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+                (self.namespace, key, time.time() - self.stale)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store value.
+
+        :param key: cache key.
+        :param value: JSON serializable value.
+        :param ttl: time to live in seconds, namespace default if omitted.
+        """
+        encoded = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, encoded, expiry(ttl or self.ttl, self.jitter)))
+            if random.randrange(self.purge_every) == 0:
+                self.purge(connection)
+
+    def purge(self, connection: sqlite3.Connection):
+        """Drop entries expired beyond the stale window and the soonest expiring ones above size limit."""
+        connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND expires <= ?", (self.namespace, time.time() - self.stale))
+        connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key IN ("
+            "SELECT key FROM entries WHERE namespace = ? ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.size))
+
+    def delete(self, key: str):
+        """Remove value by key."""
+        with self.lock:
+            self.connect().execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        """Remove all values of the namespace."""
+        with self.lock:
+            self.connect().execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+
+
+class NullCache:
+    """Cache that never stores anything, eg. to measure uncached latency.
+
+    :param namespace: cache namespace.
+    """
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return default
+
+    def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def clear(self):
+        pass
+
+
+class RefreshingCache:
+    """Stale-while-revalidate and refresh-ahead on top of a cache.
+
+    Expired entries within the stale window of the cache are served at once
+    while a background worker recomputes them, and concurrent misses of one
+    key wait for a single computation instead of all calling upstream.
+    Entries hit `refresh_hits` times during the last `refresh_ahead` share
+    of their ttl are recomputed before they expire, so hot keys never miss.
+    Refreshes run on at most `refresh_concurrency` threads and are dropped
+    when `refresh_queue` is full, and their upstream calls are admitted as
+    "refresh" traffic, keeping them from competing with interactive calls
+    for quota.
+
+    :param cache: underlying cache.
+    :param settings: namespace settings.
+    """
+    def __init__(self, cache, settings: CacheSettings):
+        self.cache = cache
+        self.settings = settings
+        self.executor = ThreadPoolExecutor(
+            settings.refresh_concurrency, thread_name_prefix=f"{cache.namespace}-refresh")
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.computing: Dict[str, Future] = {}
+        self.hits = OrderedDict()
+        self.stats = {
+            "hits": 0, "stale": 0, "misses": 0, "coalesced": 0, "refreshed": 0, "dropped": 0, "failed": 0}
+
+    def count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def fetch(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Cached value of key, computed in the calling thread on miss.
+
+        :param key: cache key.
+        :param compute: produces the JSON serializable value, also used for refreshes.
+        """
+        entry = self.cache.peek(key)
+        if entry is None:
+            return self.compute(key, compute)
+
+        value, expires = entry
+        remaining = expires - time.time()
+        if remaining <= 0:
+            self.count("stale")
+            self.schedule(key, compute)
+        else:
+            self.count("hits")
+            if remaining < self.settings.refresh_ahead * self.settings.ttl and self.hot(key):
+                self.schedule(key, compute)
+        return value
+
+    def compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Compute a missing key once, concurrent callers wait for the same result."""
+        with self.lock:
+            future = self.computing.get(key)
+            leader = future is None
+            if leader:
+                future = self.computing[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            try:
+                return future.result(deadline.timeout())
+            except FutureTimeout as e:
+                raise DeadlineExceeded("request deadline exceeded while waiting for a cache computation") from e
+            except DeadlineExceeded:
+                # the computing request was cut short, its result is still wanted here
+                return self.fetch(key, compute)
+        try:
+            value = compute()
+            self.cache.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.computing.pop(key, None)
+
+    def hot(self, key: str) -> bool:
+        """Count a hit within the refresh-ahead window, True once key had enough of them."""
+        with self.lock:
+            self.hits[key] = self.hits.get(key, 0) + 1
+            self.hits.move_to_end(key)
+            while len(self.hits) > self.settings.size:
+                self.hits.popitem(last=False)
+            return self.hits[key] >= self.settings.refresh_hits
+
+    def schedule(self, key: str, compute: Callable[[], Any]):
+        with self.lock:
+            if key in self.pending:
+                return
+            if len(self.pending) >= self.settings.refresh_queue:
+                self.stats["dropped"] += 1
+                return
+            self.pending.add(key)
+            self.hits.pop(key, None)
+        self.executor.submit(self.refresh, key, compute)
+
+    def refresh(self, key: str, compute: Callable[[], Any]):
+        try:
+            # another worker sharing the backend may have refreshed it meanwhile
+            entry = self.cache.peek(key)
+            if entry is None or entry[1] - time.time() < self.settings.refresh_ahead * self.settings.ttl:
+                with classified("refresh"):
+                    self.cache.set(key, compute())
+                self.count("refreshed")
+        except Exception as e:  # noqa: BLE001
+            self.count("failed")
+            system.logger.warning(f"{self.cache.namespace} cache refresh error, keeping stale entry: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {**self.stats, "pending": len(self.pending)}
+
+
+backends = {
+    "memory": MemoryCache,
+    "shared": SharedCache,
+    "none": NullCache
+}
+
+
+def cache_key(*parts: Any) -> str:
+    """Build stable cache key from JSON serializable parts."""
+    encoded = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_cache_settings(namespace: str) -> CacheSettings:
+    """Settings of namespace, [cache] with [cache.<namespace>] overrides."""
+    settings = CacheSettings(**getattr(system.settings, "cache", {}))
+    current = getattr(settings, namespace, None)
+    if isinstance(current, dict):
+        settings = CacheSettings(**{**settings.dict(exclude={namespace}), **current})
+    return settings
+
+
+cache_lock = threading.Lock()
+
+
+def get_cache(namespace: str):
+    """Get cache for namespace configured in [cache] settings.
+
+    Namespace specific overrides live in [cache.<namespace>] section,
+    eg. ttl for geocode results may differ from profile extraction.
+
+    :param namespace: cache namespace.
+    """
+    # first callers race from worker threads, a second copy would lose the entries stored in the first
+    with cache_lock:
+        return create_cache(namespace)
+
+
+@lru_cache()
+def create_cache(namespace: str):
+    settings = get_cache_settings(namespace)
+    if settings.backend not in backends:
+        raise RuntimeError(f"Unsupported cache backend {settings.backend}")
+    if settings.backend == "none":
+        return NullCache(namespace)
+    if settings.backend == "shared":
+        path = settings.path.replace("{cache}", system.path.cache)
+        return SharedCache(
+            namespace, settings.ttl, settings.size, path, settings.timeout, settings.stale, settings.jitter)
+    return MemoryCache(namespace, settings.ttl, settings.size, settings.stale, settings.jitter)
+
+
+refreshing_lock = threading.Lock()
+
+
+def get_refreshing_cache(namespace: str) -> RefreshingCache:
+    """Stale-while-revalidate cache of namespace, one refresh worker pool per process."""
+    # first callers race from worker threads, there must be exactly one pool
+    with refreshing_lock:
+        return create_refreshing_cache(namespace)
+
+
+@lru_cache()
+def create_refreshing_cache(namespace: str) -> RefreshingCache:
+    return RefreshingCache(get_cache(namespace), get_cache_settings(namespace))
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Optional, Tuple
+from pydantic import BaseModel
+from google.genai.types import GenerateContentResponse, EmbedContentResponse, Model
+
+
+class CassetteSettings(BaseModel, extra="allow"):
+    mode: Optional[str] = None
+    path: str = "{cache}/cassette.sqlite"
+    latency: float = 0.0
+    latency_scale: float = 0.0
+
+
+def dump(value: Any) -> Any:
+    """JSON compatible form of request parts, pydantic models included."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [dump(item) for item in value]
+    if isinstance(value, dict):
+        return {key: dump(item) for key, item in value.items()}
+    return value
+
+
+class Cassette:
+    """Recorded genai responses keyed by request hash, stored in SQLite.
+
+    Every call is a single primary key probe, so replaying long production
+    traces costs no more than the synthetic latency. Responses are stored as
+    zlib compressed JSON together with the recorded call duration.
+
+    :param path: cassette file.
+    :param mode: "record" stores new responses, "replay" serves recorded ones only.
+    :param latency: synthetic latency of replayed calls in seconds.
+    :param latency_scale: share of the recorded duration added to replayed calls.
+    """
+    def __init__(self, path: str, mode: str, latency: float = 0.0, latency_scale: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise RuntimeError(f"Unsupported cassette mode {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Open connection lazily and once per process, connections must not cross fork."""
+        if self.connection is None or self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS calls ("
+                "key TEXT PRIMARY KEY, method TEXT NOT NULL, model TEXT NOT NULL, "
+                "elapsed REAL NOT NULL, response BLOB NOT NULL) WITHOUT ROWID")
+            self.connection, self.pid = connection, os.getpid()
+        return self.connection
+
+    @staticmethod
+    def key(method: str, model: str, contents: Any = None, config: Any = None) -> str:
+        """Request hash of method, model, contents and config, per-call HTTP options such as timeouts excluded."""
+        config = dump(config)
+        if isinstance(config, dict):
+            config.pop("http_options", None)
+        encoded = json.dumps(
+            [method, model, dump(contents), config], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        """Recorded response and the delay to replay it with.
+
+        :param key: request hash.
+        """
+        with self.lock:
+            row = self.connect().execute("SELECT response, elapsed FROM calls WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise LookupError(f"No recorded response for request {key}")
+        return json.loads(zlib.decompress(row[0])), self.latency + self.latency_scale * row[1]
+
+    def put(self, key: str, method: str, model: str, elapsed: float, response: Any):
+        encoded = zlib.compress(json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self.lock:
+            self.connect().execute(
+                "INSERT OR REPLACE INTO calls (key, method, model, elapsed, response) VALUES (?, ?, ?, ?, ?)",
+                (key, method, model, elapsed, encoded))
+
+    def call(self, method: str, model: str, function, response_type, **request) -> Any:
+        """Serve a sync client call from the cassette, or perform and record it."""
+        key = self.key(method, model, request.get("contents"), request.get("config"))
+        if self.mode == "replay":
+            response, delay = self.get(key)
+            time.sleep(delay)
+            return response_type.model_validate(response)
+        started = time.perf_counter()
+        response = function(model=model, **request)
+        self.put(key, method, model, time.perf_counter() - started, dump(response))
+        return response
+
+    async def acall(self, method: str, model: str, function, response_type, **request) -> Any:
+        """Serve an async client call from the cassette, or perform and record it."""
+        key = self.key(method, model, request.get("contents"), request.get("config"))
+        if self.mode == "replay":
+            response, delay = self.get(key)
+            await asyncio.sleep(delay)
+            return response_type.model_validate(response)
+        started = time.perf_counter()
+        response = await function(model=model, **request)
+        self.put(key, method, model, time.perf_counter() - started, dump(response))
+        return response
+
+
+class CassetteModels:
+    """`client.models` replacement recording or replaying calls through a cassette.
+
+    :param models: models of the real client, None in replay mode.
+    :param cassette: cassette.
+    """
+    def __init__(self, models, cassette: Cassette):
+        self.models = models
+        self.cassette = cassette
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None) -> GenerateContentResponse:
+        return self.cassette.call(
+            "generate_content", model, self.models and self.models.generate_content, GenerateContentResponse,
+            contents=contents, config=config)
+
+    def embed_content(self, *, model: str, contents: Any, config: Any = None) -> EmbedContentResponse:
+        return self.cassette.call(
+            "embed_content", model, self.models and self.models.embed_content, EmbedContentResponse,
+            contents=contents, config=config)
+
+    def get(self, *, model: str) -> Model:
+        if self.cassette.mode == "replay":
+            return Model(name=model)
+        return self.models.get(model=model)
+
+
+class AsyncCassetteModels:
+    """`client.aio.models` replacement recording or replaying calls through a cassette.
+
+    :param models: async models of the real client, None in replay mode.
+    :param cassette: cassette.
+    """
+    def __init__(self, models, cassette: Cassette):
+        self.models = models
+        self.cassette = cassette
+
+    async def generate_content(self, *, model: str, contents: Any, config: Any = None) -> GenerateContentResponse:
+        return await self.cassette.acall(
+            "generate_content", model, self.models and self.models.generate_content, GenerateContentResponse,
+            contents=contents, config=config)
+
+    async def generate_content_stream(
+            self, *, model: str, contents: Any, config: Any = None) -> AsyncIterator[GenerateContentResponse]:
+        """Streams are recorded as the list of their chunks, replay spreads the delay over them."""
+        cassette = self.cassette
+        key = cassette.key("generate_content_stream", model, contents, config)
+        if cassette.mode == "replay":
+            chunks, delay = cassette.get(key)
+
+            async def replay():
+                for chunk in chunks:
+                    await asyncio.sleep(delay / max(len(chunks), 1))
+                    yield GenerateContentResponse.model_validate(chunk)
+            return replay()
+
+        started = time.perf_counter()
+        stream = await self.models.generate_content_stream(model=model, contents=contents, config=config)
+
+        async def record():
+            chunks = []
+            async for chunk in stream:
+                chunks.append(dump(chunk))
+                yield chunk
+            cassette.put(key, "generate_content_stream", model, time.perf_counter() - started, chunks)
+        return record()
+
+    async def get(self, *, model: str) -> Model:
+        if self.cassette.mode == "replay":
+            return Model(name=model)
+        return await self.models.get(model=model)
+
+
+class CassetteClient:
+    """Genai client wrapper serving `models` and `aio.models` through a cassette.
+
+    :param client: real client, None in replay mode.
+    :param cassette: cassette.
+    """
+    def __init__(self, client, cassette: Cassette):
+        self.client = client
+        self.models = CassetteModels(client.models if client else None, cassette)
+        self.aio = SimpleNamespace(models=AsyncCassetteModels(client.aio.models if client else None, cassette))
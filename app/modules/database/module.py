@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import os
+import time
 import asyncio
 import importlib
-from itertools import chain
+import threading
+from contextlib import asynccontextmanager
+from itertools import chain, count
 from collections import abc
 from functools import partial
 from urllib.parse import urlparse
@@ -13,6 +16,8 @@ import system
 enabled = True  # pylint: disable=C0103
 
 registry = {}
+replicas = {}
+readiness = {"ready": False, "warmed": {}}
 # responsibility = {
 #     "sqlmodel": ["sqlite", "postgresql", "mysql", "mariadb", "oracle", "mssql"]
 # }
@@ -40,11 +45,20 @@ class ValidationException(Exception):
 
 class DatabasesDict(abc.MutableMapping, dict):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        # disposals started from a running loop, awaited at shutdown
+        self.disposals = set()
+
     def __getitem__(self, key):
         value = dict.__getitem__(self, key)
         if callable(value):
-            value = value()
-            dict.__setitem__(self, key, value)
+            with self.lock:
+                value = dict.__getitem__(self, key)
+                if callable(value):
+                    value = value()
+                    dict.__setitem__(self, key, value)
         return value
 
     def __setitem__(self, key, value):
@@ -52,7 +66,17 @@ class DatabasesDict(abc.MutableMapping, dict):
 
     def __delitem__(self, key):
         value = dict.__getitem__(self, key)
-        value.dispose()
+        if not callable(value):
+            if asyncio.iscoroutinefunction(value.dispose):
+                try:
+                    task = asyncio.get_running_loop().create_task(value.dispose())
+                except RuntimeError:
+                    asyncio.run(value.dispose())
+                else:
+                    self.disposals.add(task)
+                    task.add_done_callback(self.disposed)
+            else:
+                value.dispose()
         dict.__delitem__(self, key)
 
     def __iter__(self):
@@ -61,6 +85,87 @@ class DatabasesDict(abc.MutableMapping, dict):
     def __len__(self):
         return dict.__len__(self)
 
+    def created(self):
+        """Get aliases with already created engines."""
+        return [key for key in self if not callable(dict.__getitem__(self, key))]
+
+    def disposed(self, task):
+        """Forget finished disposal and report its failure."""
+        self.disposals.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Engine dispose failed: {task.exception()}")
+
+    async def drain(self):
+        """Wait for disposals of removed engines."""
+        await asyncio.gather(*self.disposals, return_exceptions=True)
+
+    async def dispose(self, key):
+        """Dispose engine properly, awaiting async engines.
+
+        :param key: database alias.
+        """
+        value = dict.__getitem__(self, key)
+        if callable(value):
+            return
+        if asyncio.iscoroutinefunction(value.dispose):
+            await value.dispose()
+        else:
+            await asyncio.to_thread(value.dispose)
+
+
+class ReplicaSet:
+    """Read/write routing between primary alias and its replicas.
+
+    :param primary: primary database alias.
+    :param members: replica aliases.
+    :param selection: replica selection strategy, round-robin or least-connections.
+    :param cooldown: seconds a failed replica is kept out of rotation.
+    """
+    def __init__(self, primary: str, members: list, selection: str = "round-robin", cooldown: float = 30.0):
+        if selection not in ["round-robin", "least-connections"]:
+            raise TypeError(f"unsupported replica selection {selection}")
+        self.primary = primary
+        self.members = members
+        self.selection = selection
+        self.cooldown = cooldown
+        self.counter = count()
+        self.unhealthy = {}
+
+    def fail(self, member: str, duration: float = None):
+        """Take replica out of rotation.
+
+        :param member: replica alias.
+        :param duration: seconds, cooldown if omitted.
+        """
+        self.unhealthy[member] = time.monotonic() + (duration or self.cooldown)
+
+    def recover(self, member: str):
+        """Return replica into rotation."""
+        self.unhealthy.pop(member, None)
+
+    def healthy(self) -> list:
+        """Get replicas currently in rotation."""
+        now = time.monotonic()
+        return [member for member in self.members if self.unhealthy.get(member, 0) <= now]
+
+    def candidates(self, intent: str) -> list:
+        """Get aliases to try in order, primary is always the last resort.
+
+        :param intent: read or write.
+        """
+        if intent != "read":
+            return [self.primary]
+        healthy = self.healthy()
+        if healthy and self.selection == "least-connections":
+            from modules.database.sqlmodel import pool_stats  # pylint: disable=C0415
+            created = set(system.runtime.databases.created())
+            healthy.sort(key=lambda member: pool_stats(
+                system.runtime.databases[member]).get("checkedout", 0) if member in created else 0)
+        elif healthy:
+            shift = next(self.counter) % len(healthy)
+            healthy = healthy[shift:] + healthy[:shift]
+        return healthy + [self.primary]
+
 
 def bootstrap():
     """ system initialization bootstrap """
@@ -84,6 +189,15 @@ def bootstrap():
                         importlib.import_module(driver)
                         system.runtime.databases[alias] = partial(create_engine, dialect, driver, settings)
                         registry[alias] = {"dialect": dialect, "driver": driver}
+                        members = []
+                        for idx, url in enumerate(settings.get("replicas", []), start=1):
+                            member = f"{alias}@{idx}"
+                            system.runtime.databases[member] = partial(
+                                create_engine, dialect, driver, {**settings, "url": url, "replicas": []})
+                            members.append(member)
+                        replicas[alias] = ReplicaSet(
+                            alias, members, settings.get("replica-selection", "round-robin"),
+                            settings.get("replica-cooldown", 30.0))
                     if dialect not in list(chain(*responsibility.values())):
                         logger.error(f"Unsupported dialect {dialect} for {alias}")
                         result = False
@@ -106,6 +220,59 @@ def bootstrap():
     return result
 
 
+async def monitor(alias: str, max_lag: float, interval: float):
+    """Keep lagging or failing replicas out of rotation.
+
+    :param alias: primary database alias.
+    :param max_lag: maximum allowed replication lag in seconds.
+    :param interval: check interval in seconds.
+    """
+    from modules.database.sqlmodel import replication_lag  # pylint: disable=C0415
+    while True:
+        for member in replicas[alias].members:
+            try:
+                lag = await replication_lag(system.runtime.databases[member])
+            except Exception as ex:  # pylint: disable=W0718
+                logger.warning(f"Replica {member} check failed: {ex}")
+                lag = None
+            if lag is None or lag > max_lag:
+                replicas[alias].fail(member, interval * 2)
+            else:
+                replicas[alias].recover(member)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    """Create engines at worker startup, pre-warm pools and dispose them on shutdown."""
+    from modules.database.sqlmodel import prewarm  # pylint: disable=C0415
+    tasks = []
+    try:
+        for alias in system.runtime.databases:
+            engine = system.runtime.databases[alias]
+            if getattr(system.settings, "database", {}).get(alias.split("@")[0], {}).get("pool-prewarm", True):
+                try:
+                    readiness["warmed"][alias] = await prewarm(engine)
+                except Exception as ex:  # pylint: disable=W0718
+                    readiness["warmed"][alias] = str(ex)
+                    logger.warning(f"Pool pre-warm failed for {alias}: {ex}")
+        for alias, current in replicas.items():
+            settings = getattr(system.settings, "database", {}).get(alias, {})
+            if current.members and settings.get("replica-max-lag"):
+                tasks.append(asyncio.create_task(monitor(
+                    alias, settings["replica-max-lag"], settings.get("replica-check-interval", 10.0))))
+        readiness["ready"] = True
+        yield
+    finally:
+        readiness["ready"] = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for alias in system.runtime.databases.created():
+            await system.runtime.databases.dispose(alias)
+        await system.runtime.databases.drain()
+
+
 def migrate(prog: str, alias: str, args: list, schemas: str = "app/database/schemas",
             models: str = "database.models", blacklist: str = "database.schemas.blacklist",
             migrations: str = "migrations"):
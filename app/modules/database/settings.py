@@ -6,26 +6,33 @@ from pydantic import BaseModel, Field, AnyUrl
 class AlchemySettings(BaseModel, extra="forbid"):
     url: AnyUrl
     migrations: str = "migrations"
-    connect_args: Optional[dict] = Field(alias="connect-args")
-    echo: Optional[bool]
-    echo_pool: Optional[bool] = Field(alias="echo-pool")
-    enable_from_linting: Optional[bool] = Field(alias="enable-from-linting")
-    execution_options: Optional[dict] = Field(alias="execution-options")
-    hide_parameters: Optional[bool] = Field(alias="hide-parameters")
-    insertmanyvalues_page_size: Optional[int] = Field(alias="insertmanyvalues-page-size")
-    isolation_level: Optional[str] = Field(alias="isolation-level")
-    label_length: Optional[int] = Field(alias="label-length")
-    logging_name: Optional[str] = Field(alias="logging-name")
-    max_identifier_length: Optional[int] = Field(alias="max-identifier-length")
-    max_overflow: Optional[int] = Field(alias="max-overflow")
-    paramstyle: Optional[str]
-    pool_logging_name: Optional[str] = Field(alias="pool-logging-name")
-    pool_pre_ping: Optional[bool] = Field(alias="pool-pre-ping")
-    pool_size: Optional[int] = Field(alias="pool-size")
-    pool_recycle: Optional[int] = Field(alias="pool-recycle")
-    pool_reset_on_return: Optional[str] = Field(alias="pool-reset-on-return")
-    pool_timeout: Optional[int] = Field(alias="pool-timeout")
-    pool_use_lifo: Optional[bool] = Field(alias="pool-use-lifo")
-    plugins: Optional[List[str]]
-    query_cache_size: Optional[int] = Field(alias="query-cache-size")
-    use_insertmanyvalues: Optional[bool] = Field(alias="use-insertmanyvalues")
+    connect_args: Optional[dict] = Field(None, alias="connect-args")
+    echo: Optional[bool] = None
+    echo_pool: Optional[bool] = Field(None, alias="echo-pool")
+    enable_from_linting: Optional[bool] = Field(None, alias="enable-from-linting")
+    execution_options: Optional[dict] = Field(None, alias="execution-options")
+    hide_parameters: Optional[bool] = Field(None, alias="hide-parameters")
+    insertmanyvalues_page_size: Optional[int] = Field(None, alias="insertmanyvalues-page-size")
+    isolation_level: Optional[str] = Field(None, alias="isolation-level")
+    label_length: Optional[int] = Field(None, alias="label-length")
+    logging_name: Optional[str] = Field(None, alias="logging-name")
+    max_identifier_length: Optional[int] = Field(None, alias="max-identifier-length")
+    max_overflow: Optional[int] = Field(None, alias="max-overflow")
+    paramstyle: Optional[str] = None
+    pool_logging_name: Optional[str] = Field(None, alias="pool-logging-name")
+    pool_pre_ping: Optional[bool] = Field(None, alias="pool-pre-ping")
+    pool_size: Optional[int] = Field(None, alias="pool-size")
+    pool_recycle: Optional[int] = Field(None, alias="pool-recycle")
+    pool_reset_on_return: Optional[str] = Field(None, alias="pool-reset-on-return")
+    pool_timeout: Optional[int] = Field(None, alias="pool-timeout")
+    pool_use_lifo: Optional[bool] = Field(None, alias="pool-use-lifo")
+    plugins: Optional[List[str]] = None
+    query_cache_size: Optional[int] = Field(None, alias="query-cache-size")
+    use_insertmanyvalues: Optional[bool] = Field(None, alias="use-insertmanyvalues")
+    pool_prewarm: Optional[bool] = Field(None, alias="pool-prewarm")
+    statement_timeout: Optional[int] = Field(None, alias="statement-timeout")
+    replicas: Optional[List[AnyUrl]] = None
+    replica_selection: Optional[str] = Field(None, alias="replica-selection")
+    replica_max_lag: Optional[float] = Field(None, alias="replica-max-lag")
+    replica_check_interval: Optional[float] = Field(None, alias="replica-check-interval")
+    replica_cooldown: Optional[float] = Field(None, alias="replica-cooldown")
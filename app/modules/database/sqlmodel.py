@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=W0707,C0207,R0401
 import re
+import time
 import asyncio
+import inspect
 from functools import wraps
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
 import sqlmodel
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy import exc
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import exc, text
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from loguru import logger
+import system
 from modules.database.settings import AlchemySettings
-from modules.database.module import DatabaseException
+from modules.database.module import DatabaseException, replicas
 
 # just aliases for convenience
 session, async_session = sqlmodel.Session, AsyncSession
@@ -38,6 +45,261 @@ compatibility = {
 }
 
 
+# engine settings handled here, not by sqlalchemy
+extensions = {
+    "migrations", "pool_prewarm", "statement_timeout", "replicas", "replica_selection",
+    "replica_max_lag", "replica_check_interval", "replica_cooldown"
+}
+
+
+def statement_timeout(driver: str, timeout: int, connect_args: dict) -> dict:
+    """Merge server side statement timeout into driver connect arguments.
+
+    :param driver: database driver.
+    :param timeout: statement timeout in milliseconds.
+    :param connect_args: configured connect arguments.
+    """
+    connect_args = dict(connect_args or {})
+    if driver == "asyncpg":
+        server_settings = dict(connect_args.get("server_settings", {}))
+        server_settings.setdefault("statement_timeout", str(timeout))
+        connect_args["server_settings"] = server_settings
+        # client side guard as well, in case server never answers
+        connect_args.setdefault("command_timeout", timeout / 1000 + 1)
+    elif driver in ["psycopg2", "psycopg2cffi"]:
+        options = connect_args.get("options", "")
+        connect_args["options"] = f"{options} -c statement_timeout={timeout}".strip()
+    return connect_args
+
+
+def instrument(engine):
+    """Track pool checkout wait time of engine.
+
+    Sqlalchemy pools have no "before checkout" event, so raw_connection of
+    the (sync) engine is wrapped, it survives pool recreation on dispose.
+
+    :param engine: sync or async engine.
+    """
+    target = getattr(engine, "sync_engine", engine)
+    stats = {"checkouts": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0, "wait_last": 0.0}
+    raw_connection = target.raw_connection
+
+    def timed():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        except exc.TimeoutError:
+            stats["timeouts"] += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            stats["checkouts"] += 1
+            stats["wait_total"] += wait
+            stats["wait_last"] = wait
+            stats["wait_max"] = max(stats["wait_max"], wait)
+
+    target.raw_connection = timed
+    target.pool_wait = stats
+    return engine
+
+
+def pool_stats(engine) -> dict:
+    """Get engine pool statistics.
+
+    :param engine: sync or async engine.
+    """
+    target = getattr(engine, "sync_engine", engine)
+    stats = {"pool": target.pool.__class__.__name__}
+    for name in ["size", "checkedin", "checkedout", "overflow"]:
+        if hasattr(target.pool, name):
+            stats[name] = getattr(target.pool, name)()
+    wait = dict(getattr(target, "pool_wait", {}))
+    if wait:
+        wait["wait_avg"] = wait["wait_total"] / wait["checkouts"] if wait["checkouts"] else 0.0
+        stats.update(wait)
+    return stats
+
+
+async def prewarm(engine):
+    """Open pool_size connections at once and return them to the pool.
+
+    Connections opened before one of them failed are returned too, then the
+    failure is raised.
+
+    :param engine: sync or async engine.
+    """
+    target = getattr(engine, "sync_engine", engine)
+    if not hasattr(target.pool, "size"):
+        return 0
+    size = target.pool.size()
+    if isinstance(engine, AsyncEngine):
+        results = await asyncio.gather(*(engine.connect() for _ in range(size)), return_exceptions=True)
+        await asyncio.gather(*(result.close() for result in results if not isinstance(result, BaseException)))
+        failure = next((result for result in results if isinstance(result, BaseException)), None)
+        if failure is not None:
+            raise failure
+    else:
+        def warm():
+            connections = []
+            try:
+                for _ in range(size):
+                    connections.append(engine.connect())
+            finally:
+                for connection in connections:
+                    connection.close()
+        await asyncio.to_thread(warm)
+    return size
+
+
+async def replication_lag(engine):
+    """Get replication lag of postgres replica in seconds, zero when fully caught up.
+
+    :param engine: replica engine.
+    """
+    query = sqlmodel.text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")
+    if isinstance(engine, AsyncEngine):
+        async with engine.connect() as connection:
+            return (await connection.execute(query)).scalar()
+
+    def execute():
+        with engine.connect() as connection:
+            return connection.execute(query).scalar()
+    return await asyncio.to_thread(execute)
+
+
+@asynccontextmanager
+async def routed_session(alias: str, intent: str = "write"):
+    """Async session routed by intent, reads go to replicas with primary fallback.
+
+    Connection is checked out before the session is handed over, so an
+    unavailable replica is skipped (and taken out of rotation) transparently.
+
+    :param alias: database alias.
+    :param intent: read or write.
+    """
+    databases = system.runtime.databases
+    connection = None
+    for candidate in replicas[alias].candidates(intent):
+        try:
+            connection = await databases[candidate].connect()
+            break
+        except (exc.DBAPIError, OSError) as ex:
+            if candidate == alias:
+                raise
+            logger.warning(f"Replica {candidate} unavailable: {ex}")
+            replicas[alias].fail(candidate)
+    try:
+        async with AsyncSession(bind=connection) as current:
+            yield current
+    finally:
+        await connection.close()
+
+
+def group(rows: List[dict]) -> dict:
+    """Group rows by their columns, executemany requires uniform parameter sets."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    return groups
+
+
+async def upsert(current: AsyncSession, model, rows: List[dict], keys: List[str]):
+    """Insert or update many rows with executemany statements.
+
+    Sqlalchemy batches executemany into multi-row inserts (insertmanyvalues),
+    page size is controlled by insertmanyvalues-page-size of the alias.
+
+    :param current: async session.
+    :param model: table model.
+    :param rows: row values.
+    :param keys: conflict target columns.
+    """
+    for columns, batch in group(rows).items():
+        statement = postgres_insert(model)
+        # rows without conflict keys are plain inserts, eg. autoincrement ids
+        if set(keys).issubset(columns):
+            updates = {column: statement.excluded[column] for column in columns if column not in keys}
+            if updates:
+                statement = statement.on_conflict_do_update(index_elements=keys, set_=updates)
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=keys)
+        await current.execute(statement, batch)
+
+
+async def copy(current: AsyncSession, model, rows: List[dict]):
+    """Bulk load rows with COPY when driver is asyncpg, plain executemany otherwise.
+
+    The asyncpg adapter of sqlalchemy opens its transaction lazily with the
+    first statement, and COPY goes straight to the driver connection, so a
+    transaction is started first when none is open; COPY then commits or
+    rolls back together with the session.
+
+    :param current: async session, COPY joins its transaction.
+    :param model: table model.
+    :param rows: row values.
+    """
+    connection = await current.connection()
+    for columns, batch in group(rows).items():
+        if connection.dialect.driver != "asyncpg":
+            await current.execute(sqlmodel.insert(model), batch)
+            continue
+        raw = await connection.get_raw_connection()
+        if not raw.driver_connection.is_in_transaction():
+            await current.execute(text("SELECT 1"))
+        await raw.driver_connection.copy_records_to_table(
+            model.__tablename__, columns=list(columns), records=[tuple(row.values()) for row in batch])
+
+
+def keyset(statement, column, after=None, limit: int = 100):
+    """Apply keyset (cursor) pagination to select statement.
+
+    :param statement: select statement.
+    :param column: unique, ordered cursor column.
+    :param after: cursor value of the last row of previous page.
+    :param limit: page size.
+    """
+    if after is not None:
+        statement = statement.where(column > after)
+    return statement.order_by(column).limit(limit)
+
+
+async def pages(alias: str, statement, column, after=None, size: int = 1000) -> AsyncIterator[list]:
+    """Iterate over keyset pages, every page uses its own short-lived read session.
+
+    :param alias: database alias.
+    :param statement: select statement.
+    :param column: unique, ordered cursor column.
+    :param after: cursor value to start after.
+    :param size: page size.
+    """
+    while True:
+        async with routed_session(alias, "read") as current:
+            page = (await current.exec(keyset(statement, column, after, size))).all()
+        if page:
+            yield page
+        if len(page) < size:
+            return
+        after = getattr(page[-1], column.key)
+
+
+async def stream(alias: str, statement, size: int = 1000) -> AsyncIterator[list]:
+    """Iterate over partitions fetched through server-side cursor.
+
+    Unlike pages, single read session (and transaction) is held open until
+    iteration is complete.
+
+    :param alias: database alias.
+    :param statement: select statement.
+    :param size: partition size.
+    """
+    async with routed_session(alias, "read") as current:
+        result = await current.stream_scalars(statement.execution_options(yield_per=size))
+        async for partition in result.partitions():
+            yield partition
+
+
 def create_engine(dialect: str, driver: str, settings: dict):
     """Create database engine.
 
@@ -46,9 +308,13 @@ def create_engine(dialect: str, driver: str, settings: dict):
     :param settings: database settings.
     """
     settings = AlchemySettings(**settings)
+    params = settings.dict(exclude=extensions, exclude_defaults=True)
+    params["url"] = str(settings.url)
+    if settings.statement_timeout:
+        params["connect_args"] = statement_timeout(driver, settings.statement_timeout, settings.connect_args)
     if compatibility[dialect][driver] == "sync":
-        return sqlmodel.create_engine(**settings.dict(exclude={"migrations"}, exclude_defaults=True))
-    return create_async_engine(**settings.dict(exclude={"migrations"}, exclude_defaults=True))
+        return instrument(sqlmodel.create_engine(**params))
+    return instrument(create_async_engine(**params))
 
 
 def sqlmodel_exceptions(function: callable):
@@ -71,6 +337,18 @@ def sqlmodel_exceptions(function: callable):
         except ConnectionRefusedError as ex:  # special case for some new drivers
             raise DatabaseException("Connection refused", ex)
 
+    @wraps(function)
+    async def wrapper_generator(*args, **kwargs):
+        try:
+            async for item in function(*args, **kwargs):
+                yield item
+        except exc.SQLAlchemyError as ex:
+            raise DatabaseException(re.sub(r"[\"()]", "", str(ex).split("\n")[0].replace(") (", ": ")), ex)
+        except ConnectionRefusedError as ex:  # special case for some new drivers
+            raise DatabaseException("Connection refused", ex)
+
+    if inspect.isasyncgenfunction(function):
+        return wrapper_generator
     if asyncio.iscoroutinefunction(function):
         return wrapper_async
     return wrapper
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional
+from pydantic import BaseModel, Field
+import system
+
+
+class DeadlineSettings(BaseModel, extra="allow"):
+    """
+    Request deadlines, configured in [deadline].
+
+    Clients send the seconds they are willing to wait in `header`; requests
+    without it get the default of the longest matching path prefix in
+    `routes`, or `default`. Without either the request has no deadline, so
+    streamed database listings and other non-LLM routes run to completion.
+    Deadlines are capped by `maximum`.
+    """
+    header: str = "X-Request-Timeout"
+    default: Optional[float] = None
+    maximum: float = 120.0
+    routes: Dict[str, float] = Field(default_factory=lambda: {
+        "/api/profile/extract": 60.0, "/api/profile/notes/stream": 60.0, "/api/profile/geocode": 60.0})
+
+
+class DeadlineExceeded(Exception):
+    """Request deadline passed or its client disconnected, upstream work is pointless."""
+
+
+class Deadline:
+    """
+    Deadline of one request, shared with the worker threads serving it.
+
+    :param expires: `time.monotonic()` the client stops waiting at.
+    """
+    def __init__(self, expires: float):
+        self.expires = expires
+        self.cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+
+current: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+# requests cut short and upstream calls never started because nobody waits for their result
+stats = {"requests": 0, "disconnects": 0, "timeouts": 0, "cancelled": 0, "skippedCalls": 0}
+
+
+def get_deadline_settings() -> DeadlineSettings:
+    return DeadlineSettings(**getattr(system.settings, "deadline", {}))
+
+
+def budget(settings: DeadlineSettings, path: str, value: Optional[str]) -> Optional[float]:
+    """
+    Seconds a request may take, None without a deadline.
+
+    :param settings: deadline settings.
+    :param path: request path, selects the route default.
+    :param value: header value sent by the client, if any.
+    """
+    seconds = None
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = None
+    # "nan" and "inf" parse as floats but bound nothing
+    if seconds is None or not math.isfinite(seconds) or seconds <= 0:
+        prefixes = [prefix for prefix in settings.routes if path.startswith(prefix)]
+        seconds = settings.routes[max(prefixes, key=len)] if prefixes else settings.default
+    return None if seconds is None else min(seconds, settings.maximum)
+
+
+def timeout() -> Optional[float]:
+    """
+    Seconds left for an upstream call of the current request, None outside requests.
+
+    Raises DeadlineExceeded when the deadline passed or the client disconnected,
+    so the call is not started at all.
+    """
+    deadline = current.get()
+    if deadline is None:
+        return None
+    remaining = deadline.remaining()
+    if deadline.cancelled.is_set() or remaining <= 0:
+        stats["skippedCalls"] += 1
+        raise DeadlineExceeded("request deadline exceeded or client disconnected")
+    return remaining
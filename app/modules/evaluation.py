@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import asyncio
+import statistics
+from typing import Any, Dict, List, Optional
+
+import system
+from modules.genai import VALUE_TO_ID, UserProfile, usage_scope
+from modules.genai import merge_profile_from_text, geocode_with_gemini
+
+SCALARS = (
+    "travelMode", "budgetPreference", "crowdPreference", "hiddenGemPreference",
+    "resetTravelMode", "resetBudgetPreference", "resetEntityTypeValues", "replaceEntityTypeValues",
+)
+
+
+def entity_ids(delta: Dict[str, Any], ids: str, values: str) -> set:
+    """Entity IDs of a delta given either as IDs or as taxonomy values."""
+    if delta.get(ids) is not None:
+        return set(delta[ids])
+    return {VALUE_TO_ID[value] for value in delta.get(values) or [] if value in VALUE_TO_ID}
+
+
+def f1(expected: set, predicted: set) -> float:
+    """F1 score of predicted labels, 1.0 when both are empty."""
+    if not expected and not predicted:
+        return 1.0
+    hits = len(expected & predicted)
+    if not hits:
+        return 0.0
+    precision, recall = hits / len(predicted), hits / len(expected)
+    return 2 * precision * recall / (precision + recall)
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def score_extract(expected: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Entity-ID F1 over likes and dislikes and exact match of expected scalar fields.
+
+    :param expected: expected delta, entities as IDs or taxonomy values.
+    :param delta: extracted delta.
+    """
+    labels = {("like", i) for i in entity_ids(expected, "entityTypeIds", "entityTypeValues")}
+    labels |= {("dislike", i) for i in entity_ids(expected, "excludedEntityTypeIds", "excludedEntityTypeValues")}
+    predicted = {("like", i) for i in delta.get("entityTypeIds") or []}
+    predicted |= {("dislike", i) for i in delta.get("excludedEntityTypeIds") or []}
+    scalars = [key for key in SCALARS if key in expected]
+    return {
+        "entityF1": round(f1(labels, predicted), 3),
+        "scalarMatch": sum(delta.get(key) == expected[key] for key in scalars) / len(scalars) if scalars else None,
+        "source": delta.get("source"),
+    }
+
+
+def score_geocode(expected: Dict[str, Any], result: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    """Distance error in km, correctness within tolerance and country match.
+
+    Expected null coordinates mean a generic query, correct when nothing is resolved.
+
+    :param expected: expected lat, lon and optionally countryCode.
+    :param result: geocode result.
+    :param tolerance: distance in km still counted as correct.
+    """
+    if "error" in result:
+        return {"error": result["error"], "correct": False}
+    distance = None
+    if expected.get("lat") is None:
+        correct = result.get("lat") is None
+    elif result.get("lat") is None or result.get("lon") is None:
+        correct = False
+    else:
+        distance = round(haversine(expected["lat"], expected["lon"], result["lat"], result["lon"]), 3)
+        correct = distance <= tolerance
+    country = None
+    if expected.get("countryCode"):
+        country = (result.get("countryCode") or "").upper() == expected["countryCode"].upper()
+    return {"distanceKm": distance, "correct": correct, "countryMatch": country}
+
+
+async def run_case(case: Dict[str, Any], semaphore: asyncio.Semaphore, tolerance: float) -> Dict[str, Any]:
+    """Run one dataset case through the genai functions, with its latency and token usage.
+
+    :param case: dataset case.
+    :param semaphore: bounds the number of concurrent cases.
+    :param tolerance: geocode distance tolerance in km.
+    """
+    async with semaphore:
+        # every case runs in its own task, so the usage scope is per case
+        scope: Dict[str, float] = {}
+        usage_scope.set(scope)
+        started = time.perf_counter()
+        try:
+            if case["kind"] == "extract":
+                state = UserProfile(**(case.get("currentState") or {}))
+                _, delta = await asyncio.to_thread(
+                    merge_profile_from_text, case["text"], case.get("locale", "en"), state, True)
+                metrics = score_extract(case["expected"], delta)
+            elif case["kind"] == "geocode":
+                result = await asyncio.to_thread(geocode_with_gemini, case["query"], case.get("locale", "en"))
+                metrics = score_geocode(case["expected"], result, tolerance)
+            else:
+                raise ValueError(f"Unsupported case kind {case['kind']}")
+        except Exception as e:  # noqa: BLE001
+            system.logger.warning(f"evaluation case {case.get('id')} error: {e}")
+            metrics = {"error": str(e)}
+        return {
+            "id": case.get("id"),
+            "kind": case["kind"],
+            "seconds": round(time.perf_counter() - started, 3),
+            "calls": scope.get("calls", 0),
+            "tokens": sum(scope.get(key, 0) for key in ("promptTokens", "outputTokens", "thoughtsTokens")),
+            **metrics,
+        }
+
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate accuracy, latency and token cost per case kind."""
+    summary = {}
+    for kind in sorted({result["kind"] for result in results}):
+        cases = [result for result in results if result["kind"] == kind]
+        seconds = [case["seconds"] for case in cases]
+        current = {
+            "cases": len(cases),
+            "errors": sum(1 for case in cases if "error" in case),
+            "latencyP50": percentile(seconds, 0.5),
+            "latencyP95": percentile(seconds, 0.95),
+            "calls": sum(case["calls"] for case in cases),
+            "tokens": sum(case["tokens"] for case in cases),
+        }
+        if kind == "extract":
+            scores = [case["entityF1"] for case in cases if "entityF1" in case]
+            scalars = [case["scalarMatch"] for case in cases if case.get("scalarMatch") is not None]
+            current["entityF1"] = round(statistics.mean(scores), 3) if scores else None
+            current["scalarMatch"] = round(statistics.mean(scalars), 3) if scalars else None
+        else:
+            distances = [case["distanceKm"] for case in cases if case.get("distanceKm") is not None]
+            current["correct"] = round(sum(1 for case in cases if case.get("correct")) / len(cases), 3)
+            current["distanceP50"] = percentile(distances, 0.5)
+            current["distanceP95"] = percentile(distances, 0.95)
+        summary[kind] = current
+    return summary
+
+
+async def evaluate(cases: List[Dict[str, Any]], concurrency: int, tolerance: float) -> List[Dict[str, Any]]:
+    """Run dataset cases with bounded concurrency, results keep the dataset order.
+
+    :param cases: dataset cases.
+    :param concurrency: maximum number of cases in flight.
+    :param tolerance: geocode distance tolerance in km.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(run_case(case, semaphore, tolerance) for case in cases))
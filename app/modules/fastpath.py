@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+import re
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+import system
+
+
+# taxonomy values and their phrases, lowercase; a trailing "*" matches any ending of the last word
+SYNONYMS: Dict[str, List[str]] = {
+    "Museum": ["museum*", "музе*"],
+    "Art gallery": [
+        "art gallery", "art galleries", "картинная галерея", "картинные галереи",
+        "картинных галерей"],
+    "Gallery": ["gallery", "galleries", "галере*"],
+    "Theater": ["theater*", "theatre*", "театр*"],
+    "Opera House": ["opera", "opera house*", "опера", "оперу", "оперы", "оперный театр"],
+    "Cinema": ["cinema*", "movie theater*", "кино", "кинотеатр*"],
+    "Concert": ["concert*", "концерт*"],
+    "Cathedral": ["cathedral*", "собор*"],
+    "Church": ["church*", "церк*", "церков*", "храм*"],
+    "Mosque": ["mosque*", "мечет*"],
+    "Synagogue": ["synagogue*", "синагог*"],
+    "Temple": ["temple*"],
+    "Monastery": ["monaster*", "монастыр*"],
+    "Castle": ["castle*", "замок", "замки", "замков"],
+    "Fortress": ["fortress*", "крепост*"],
+    "Palace": ["palace*", "дворец", "дворцы", "дворцов"],
+    "Ruins": ["ruins", "руин*", "развалин*"],
+    "Monument": ["monument*", "памятник*"],
+    "Old town": [
+        "old town", "old city", "старый город", "старом городе", "старого города",
+        "старому городу", "старым городом"],
+    "Bridge": ["bridge*", "мост", "мосты", "мостов"],
+    "Tower": ["tower*", "башн*"],
+    "Viewpoint": [
+        "viewpoint*", "смотровые площадки", "смотровая площадка",
+        "смотровых площадок"],
+    "Park": ["park", "parks", "парк", "парки", "парков", "парке"],
+    "Botanical Garden": [
+        "botanical garden*", "ботанический сад", "ботанические сады",
+        "ботанических садов"],
+    "National Park": [
+        "national park*", "национальный парк", "национальные парки",
+        "национальных парков", "заповедник*"],
+    "Beach": ["beach", "beaches", "пляж*"],
+    "Lake": ["lake", "lakes", "озер*", "озёр*"],
+    "River": ["river", "rivers", "река", "реки", "рек", "реку"],
+    "Mountain": ["mountain*", "гор", "горы", "горах"],
+    "Waterfall": ["waterfall*", "водопад*"],
+    "Cave": ["cave", "caves", "пещер*"],
+    "Forest": ["forest*", "лес", "леса", "лесу"],
+    "Hiking Trail": ["hiking", "hikes", "trekking", "поход*", "треккинг*"],
+    "Zoo": ["zoo", "zoos", "зоопарк*"],
+    "Aquarium": ["aquarium*", "аквариум*", "океанариум*"],
+    "Amusement Park": [
+        "amusement park*", "theme park*", "парк развлечений", "парки развлечений",
+        "парк аттракционов"],
+    "Stadium": ["stadium*", "стадион*"],
+    "Library": ["librar*", "библиотек*"],
+    "Market": ["market", "markets", "bazaar*", "рынок", "рынки", "рынков", "базар*"],
+    "Flea Market": ["flea market*", "барахолк*", "блошиный рынок", "блошиные рынки"],
+    "Food Market": ["food market*", "фермерский рынок", "фермерские рынки"],
+    "Shopping Mall": ["mall", "malls", "shopping mall*", "shopping center*", "shopping centre*",
+        "торговый центр", "торговые центры", "торговых центров",
+        "торговом центре", "тц"],
+    "Souvenir Shop": ["souvenir*", "сувенир*"],
+    "Bookstore": [
+        "bookstore*", "bookshop*", "book store*", "книжный магазин", "книжные магазины",
+        "книжных магазинов"],
+    "Cafe": ["cafe", "cafes", "café", "cafés", "кафе"],
+    "Coffee shop": ["coffee shop*", "coffee", "кофейн*", "кофе"],
+    "Restaurant": ["restaurant*", "ресторан*"],
+    "Bar": ["bar", "bars", "бар", "бары", "баров"],
+    "Pub": ["pub", "pubs", "паб*"],
+    "Rooftop Bar": ["rooftop bar*", "rooftop*", "бар на крыше", "бары на крыше"],
+    "Wine Bar": ["wine bar*", "винный бар", "винные бары", "винных баров"],
+    "Winery": [
+        "winer*", "vineyard*", "wine tasting*", "виноградник*", "винодельн*",
+        "дегустация вин", "дегустации вин"],
+    "Brewery": ["brewer*", "пивоварн*"],
+    "Bakery": ["baker*", "пекарн*"],
+    "Street Food": ["street food", "уличная еда", "уличную еду", "стритфуд"],
+    "Night Club": [
+        "nightclub*", "night club*", "clubbing", "ночной клуб", "ночные клубы",
+        "ночных клубов"],
+    "Spa": ["spa", "spas", "спа"],
+    "Hot Spring": [
+        "hot spring*", "термальные источники", "термальных источников",
+        "горячие источники", "горячих источников"],
+    "Hammam": ["hammam*", "хаммам*", "хамам*"],
+    "Sulfur baths": [
+        "sulfur bath*", "sulphur bath*", "серные бани", "серных банях", "серных бань"],
+    "Cable car": [
+        "cable car*", "канатная дорога", "канатную дорогу",
+        "канатные дороги"],
+    "Funicular": ["funicular*", "фуникулер*", "фуникулёр*"],
+}
+
+TRAVEL_MODES: Dict[str, List[str]] = {
+    "walk": ["walk*", "on foot", "пешком", "пешие прогулки", "гулять"],
+    "car": [
+        "by car", "car", "drive", "driving", "на машине", "на автомобиле", "за рулем",
+        "за рулём"],
+    "bike": ["bike", "bikes", "by bike", "bicycle*", "cycling", "велосипед*", "на велосипеде"],
+    "public_transport": [
+        "public transport*", "bus", "buses", "metro", "subway", "tram", "trams",
+        "общественный транспорт", "общественном транспорте",
+        "на автобусе", "на метро", "на трамвае"],
+}
+
+# sentiment cues, the longest match wins, so "don't like" beats "like"
+CUES: Dict[str, int] = {
+    **{cue: 1 for cue in [
+        "love", "like", "likes", "enjoy", "enjoys", "adore", "prefer", "into", "want", "want to see", "interested in",
+        "fan of", "fond of", "would like", "люблю", "нравится", "нравятся", "обожаю",
+        "хочу", "хотим", "интересуют", "интересует", "предпочитаю"]},
+    **{cue: -1 for cue in [
+        "hate", "hates", "dislike", "dislikes", "avoid", "no", "not", "never", "without", "skip", "don't like",
+        "dont like", "do not like", "don't want", "dont want", "do not want", "not into", "not interested in",
+        "not a fan of", "can't stand", "cannot stand", "no more", "boring", "не люблю", "не нравится",
+        "не нравятся", "ненавижу", "не хочу", "не хотим", "избегаю", "без",
+        "не интересуют", "не интересует", "никаких", "скучн*"]},
+}
+
+# words that carry no preference, texts made of matches and these words only are trivially classifiable
+STOPWORDS = set("""
+i i'm i'll i'd im ll m am a an the and or but also too so very really much a lot of to in at on for with by my me we us
+our
+it them they is are be will would just please go going visit visiting see seeing places place spots things
+stuff especially mostly all kinds lots rather more
+я мы мне нам и или но а тоже также очень просто в во на по к с со для
+места местах место все всё особенно
+""".split())
+
+# words joining values a negative cue still applies to, "no malls or casinos"
+CONJUNCTIONS = {"and", "or", "nor", "и", "или", "ни"}
+
+CLAUSE_BREAKS = re.compile(r"[.;!?\n]| but | however | но | однако ")
+
+
+class Automaton:
+    """Aho-Corasick automaton, finds all phrase occurrences in a single pass over the text.
+
+    :param phrases: lowercase phrase to payload mapping; a trailing "*" lets the
+        last word continue, eg. "museum*" matches "museums".
+    """
+    def __init__(self, phrases: Dict[str, Any]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, bool, Any]]] = [[]]
+        for phrase, payload in phrases.items():
+            prefix = phrase.endswith("*")
+            phrase = phrase.rstrip("*")
+            state = 0
+            for char in phrase:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(phrase), prefix, payload))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, target in self.goto[state].items():
+                queue.append(target)
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[target] = self.goto[fallback].get(char, 0)
+                self.output[target] = self.output[target] + self.output[self.fail[target]]
+
+    def find(self, text: str) -> List[Tuple[int, int, Any]]:
+        """Find whole word occurrences as (start, end, payload), leftmost-longest and non-overlapping.
+
+        :param text: lowercase text.
+        """
+        found = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, prefix, payload in self.output[state]:
+                start, end = index - length + 1, index + 1
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if prefix:
+                    while end < len(text) and text[end].isalnum():
+                        end += 1
+                elif end < len(text) and text[end].isalnum():
+                    continue
+                found.append((start, end, payload))
+        found.sort(key=lambda match: (match[0], match[0] - match[1]))
+        matches, position = [], 0
+        for start, end, payload in found:
+            if start >= position:
+                matches.append((start, end, payload))
+                position = end
+        return matches
+
+
+class LocalExtraction(BaseModel):
+    """Result of the local extractor, fields follow the LLM extraction output."""
+    travelMode: Optional[str] = None
+    entityTypeValues: List[str] = Field(default_factory=list)
+    excludedEntityTypeValues: List[str] = Field(default_factory=list)
+    confidence: float = 0.0
+
+
+automaton = Automaton({
+    **{phrase: ("value", value) for value, phrases in SYNONYMS.items() for phrase in phrases},
+    **{phrase: ("mode", mode) for mode, phrases in TRAVEL_MODES.items() for phrase in phrases},
+    **{phrase: ("cue", polarity) for phrase, polarity in CUES.items()},
+})
+
+
+def extract(text: str) -> LocalExtraction:
+    """
+    Extract place type likes/dislikes and travel mode without the LLM.
+
+    Every value takes the polarity of the nearest cue before it in the same
+    clause ("love museums and hate malls"), or of a trailing cue after it
+    ("museums, love them"), positive when there is none. A clause opened by
+    a bare negation ("Museums? No." or "Museums? No, parks.") answers the
+    clause before it; when that clause has a positive cue of its own the
+    text is left to the LLM. A negative cue covers the next value and the
+    values joined to it by a conjunction only; a bare list after it ("not
+    museums, parks") may already be positive, such texts score 0.
+    Confidence is the share of words explained by matches and stopwords;
+    texts with anything else (budget, crowds, exclusivity, conflicting
+    modes) score low and should go to the LLM.
+
+    :param text: user text.
+    """
+    lowered = text.lower().replace("’", "'")
+    matches = automaton.find(lowered)
+    if not any(kind != "cue" for _, _, (kind, _) in matches):
+        return LocalExtraction()
+
+    clauses = [match.start() for match in CLAUSE_BREAKS.finditer(lowered)]
+
+    def clause(position: int) -> int:
+        return sum(1 for start in clauses if start < position)
+
+    # a cue followed by a value in its clause applies forward ("hate malls"), otherwise backward ("malls, hate them")
+    valued = {clause(start) for start, _, (kind, _) in matches if kind != "cue"}
+    cues = []
+    for index, (start, end, (kind, polarity)) in enumerate(matches):
+        if kind != "cue":
+            continue
+        current = clause(start)
+        if polarity < 0 and current > 0 and (current not in valued or lowered[end:end + 1] == ","):
+            # bare negation ("No." or "No, parks"), a trailing cue of the previous clause
+            cues.append((start, current - 1, polarity, False, True))
+            continue
+        forward = any(match[2][0] != "cue" and clause(match[0]) == current for match in matches[index + 1:])
+        cues.append((start, current, polarity, forward, False))
+
+    likes, dislikes, modes = [], [], set()
+    ambiguous = False
+    for index, (start, _, (kind, payload)) in enumerate(matches):
+        if kind == "cue":
+            continue
+        current = clause(start)
+        before = [cue for cue in cues if cue[3] and cue[1] == current and cue[0] < start]
+        if before and before[-1][2] < 0:
+            listed = [match for match in matches[:index] if match[2][0] != "cue" and match[0] > before[-1][0]]
+            if listed and not CONJUNCTIONS & set(re.findall(r"\w+", lowered[listed[-1][1]:start])):
+                ambiguous = True
+        after = [cue for cue in cues if not cue[3] and cue[1] == current and cue[0] > start]
+        bare = [cue for cue in after if cue[4]]
+        if bare and before and before[-1][2] > 0:
+            return LocalExtraction()
+        polarity = bare[0][2] if bare else before[-1][2] if before else after[0][2] if after else 1
+        if kind == "mode":
+            # negated travel mode cannot be expressed as a delta
+            if polarity < 0:
+                return LocalExtraction()
+            modes.add(payload)
+        elif polarity < 0:
+            dislikes.append(payload)
+        else:
+            likes.append(payload)
+    if len(modes) > 1:
+        return LocalExtraction()
+
+    words = list(re.finditer(r"[\w']+", lowered))
+    explained = 0
+    for word in words:
+        if word.group() in STOPWORDS or any(start <= word.start() < end for start, end, _ in matches):
+            explained += 1
+
+    return LocalExtraction(
+        travelMode=next(iter(modes), None),
+        entityTypeValues=list(dict.fromkeys(likes)),
+        excludedEntityTypeValues=list(dict.fromkeys(dislikes)),
+        confidence=round(explained / len(words), 3) if words and not ambiguous else 0.0,
+    )
+
+
+def agreement(local: LocalExtraction, output: Any) -> Dict[str, bool]:
+    """Compare local extraction with the LLM output of the same text, per field.
+
+    :param local: local extraction.
+    :param output: LLM extraction output (or a dict with the same keys).
+    """
+    if isinstance(output, dict):
+        output = LocalExtraction(**{key: output.get(key) or default for key, default in (
+            ("travelMode", None), ("entityTypeValues", []), ("excludedEntityTypeValues", []))})
+    return {
+        "travelMode": local.travelMode == output.travelMode,
+        "entityTypeValues": set(local.entityTypeValues) == set(output.entityTypeValues),
+        "excludedEntityTypeValues": set(local.excludedEntityTypeValues) == set(output.excludedEntityTypeValues),
+    }
+
+
+lock = threading.Lock()
+
+
+def log(path: str, text: str, local: LocalExtraction, output: Dict[str, Any]):
+    """Append LLM extraction output next to the local extraction of the same text.
+
+    The log is the reference for measuring local accuracy, see `genai:fastpath` command.
+
+    :param path: JSON lines file, "{logs}" is replaced with logs location.
+    :param text: user text.
+    :param local: local extraction.
+    :param output: LLM extraction output.
+    """
+    path = path.replace("{logs}", system.path.logs)
+    record = {
+        "text": text,
+        "local": local.model_dump(),
+        "llm": {key: output.get(key) for key in ("travelMode", "entityTypeValues", "excludedEntityTypeValues")},
+    }
+    with lock, open(path, "a", encoding="utf-8") as handle:
+        handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# words that do not make a place query specific ("a cozy cafe nearby")
+DETERMINERS = set("""
+a an the some any few several one nice good best great cozy cosy cheap local nearby near around close closest
+me here open popular famous top quiet small big little interesting beautiful old new and or with for to find
+какой какая какое какие какой-нибудь какое-нибудь какая-нибудь
+где-нибудь хороший хорошее хорошая хорошие
+уютный уютное уютная уютные ближайший ближайшее ближайшая
+ближайшие рядом недорогой недорогое недорогая
+популярный популярное популярная красивый красивое красивая
+лучший лучшее лучшая лучшие и или с
+""".split())
+
+
+class GenericDetector:
+    """Recognize pure place category queries ("a cafe", "beach", "музей").
+
+    A query is generic when it names a single taxonomy value (or its
+    synonym), optionally with determiners; any other word, eg. a proper
+    name, makes it specific. Several values ("Old Town Square") and
+    capitalized values of several words ("Sulfur baths") may name a
+    landmark, those are left to the model and its learned "generic" cache.
+
+    :param values: taxonomy values, their lowercase form and plural are matched as well.
+    """
+    def __init__(self, values: List[str]):
+        phrases = {}
+        for value in values:
+            phrases[value.lower()] = value
+            phrases[value.lower() + "s"] = value
+        for value, synonyms in SYNONYMS.items():
+            phrases.update(dict.fromkeys(synonyms, value))
+        self.automaton = Automaton(phrases)
+
+    def __call__(self, query: str) -> Optional[List[str]]:
+        """Matched taxonomy values of a generic query, None when the query is specific.
+
+        :param query: place query.
+        """
+        original = query.replace("’", "'").strip()
+        text = original.lower()
+        matches = self.automaton.find(text)
+        if len(matches) != 1:
+            return None
+        start, end, value = matches[0]
+        for word in re.finditer(r"[\w'-]+", text):
+            if word.group() not in DETERMINERS and not start <= word.start() < end:
+                return None
+        if len(text) == len(original) and " " in text[start:end] and any(
+                char.isupper() for char in original[start:end]):
+            return None
+        return [value]
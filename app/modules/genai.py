@@ -1,18 +1,38 @@
 # app/modules/genai.py
 # -*- coding: utf-8 -*-
 
+import asyncio
+import contextvars
+import importlib.util
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from functools import lru_cache
 import json
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any, Tuple
+import httpx
+from pydantic import BaseModel, Field, ValidationError, ValidatorFunctionWrapHandler
+from pydantic import BeforeValidator, WrapValidator
+from typing import Optional, List, Dict, Any, Tuple, Literal, Annotated, AsyncIterator
 
 
 import system
+from modules.cache import get_cache, get_refreshing_cache, cache_key
+from modules import fastpath, locales, deadline
+from modules.deadline import DeadlineExceeded
+from modules.semantic import SemanticSettings, SemanticCache, HashingEmbedder, normalize
+from modules.cassette import CassetteSettings, Cassette, CassetteClient
+from modules.scheduler import SchedulerSettings, Scheduler, ScheduledClient, traffic
 
 from google import genai
+from google.auth.transport.requests import Request as AuthRequest
 from google.oauth2 import service_account
 from google.genai.types import (
     GenerateContentConfig,
+    HttpOptions,
     Content,
     Part,
     Type,
@@ -23,33 +43,341 @@ from google.genai.types import (
     FunctionCallingConfig,
     FunctionCallingConfigMode,
     ThinkingConfig,
+    EmbedContentConfig,
 )
 
 
+class GenerationPolicy(BaseModel):
+    """
+    Generation limits of one LLM function, configured in [genai.policies.<name>].
+
+    Inputs shorter than `short_length` characters go to `short_model`
+    (eg. flash-lite for short chat messages), others to `model`, which falls
+    back to the function's default model. Thinking budget 0 disables thinking,
+    None keeps the model default.
+    """
+    model: Optional[str] = None
+    short_model: Optional[str] = None
+    short_length: int = 0
+    thinking_budget: Optional[int] = None
+    max_output_tokens: Optional[int] = None
+
+
+class BatchSettings(BaseModel, extra="allow"):
+    """
+    Micro-batching of extraction calls, configured in [genai.batch].
+
+    Texts arriving within `max_wait` milliseconds are packed, up to `max_size`,
+    into one generate_content call; items missing from a batch response are
+    extracted one by one when `fallback` is set.
+    """
+    enabled: bool = False
+    max_wait: float = 10.0
+    max_size: int = 8
+    concurrency: int = 8
+    fallback: bool = True
+
+
+DEFAULT_POLICIES = {
+    "extract": {"thinking_budget": 0, "max_output_tokens": 1024},
+    "notes": {"thinking_budget": 0, "max_output_tokens": 512},
+    # geocoding decides between generic and specific places, keep some room to think
+    "geocode": {"thinking_budget": 1024, "max_output_tokens": 2048},
+    "geocode_grounded": {"thinking_budget": 1024, "max_output_tokens": 4096},
+    "geocode_candidates": {"thinking_budget": 1024, "max_output_tokens": 4096},
+    "localize": {"thinking_budget": 0, "max_output_tokens": 256},
+}
+
+
+class GenaiSettings(BaseModel, extra="allow"):
+    service_account_file: Optional[str] = None
+    project: Optional[str] = None
+    location: str = "us-central1"
+    extract_model: str = "gemini-2.5-flash"
+    geocode_model: str = "gemini-2.5-flash"
+    pool_size: int = 32
+    pool_keepalive: int = 16
+    keepalive_expiry: float = 90.0
+    http2: bool = True
+    warmup: bool = True
+    warmup_retry: float = 15.0
+    refresh_margin: float = 300.0
+    geocode_confidence: float = 0.8
+    geocode_grounding: bool = True
+    geocode_candidates: int = 5
+    geocode_log: Optional[str] = None
+    fastpath: bool = True
+    fastpath_threshold: float = 0.9
+    fastpath_log: Optional[str] = None
+    semantic: SemanticSettings = Field(default_factory=SemanticSettings)
+    cassette: CassetteSettings = Field(default_factory=CassetteSettings)
+    batch: BatchSettings = Field(default_factory=BatchSettings)
+    scheduler: SchedulerSettings = Field(default_factory=SchedulerSettings)
+    policies: Dict[str, GenerationPolicy] = Field(default_factory=dict)
+
+
+readiness = {"ready": False, "error": None, "refreshed": None}
+
+# token and latency accounting per policy and model, see `record_usage`
+usage_stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+# optional per task accounting, eg. per evaluation case, see `record_usage`
+usage_scope: ContextVar[Optional[Dict[str, float]]] = ContextVar("usage_scope", default=None)
+
+
 @lru_cache()
-def get_genai_client() -> genai.Client:
-    cfg = getattr(system.settings, "genai", {})
+def get_genai_settings() -> GenaiSettings:
+    current = dict(getattr(system.settings, "genai", {}))
+    # configured policy keys override the defaults one by one
+    policies = {name: dict(policy) for name, policy in DEFAULT_POLICIES.items()}
+    for name, policy in (current.get("policies") or {}).items():
+        policies[name] = {**policies.get(name, {}), **policy}
+    return GenaiSettings(**{**current, "policies": policies})
+
+
+def get_policy(
+        name: str, config: GenerateContentConfig, default_model: str, text: str = ""
+) -> Tuple[str, GenerateContentConfig]:
+    """
+    Resolve model and generation config of a function by its policy.
+
+    :param name: policy name, eg. extract, notes or geocode.
+    :param config: base config of the function, it is not modified.
+    :param default_model: model used when the policy does not set one.
+    :param text: user input, its length selects the short model.
+
+    Within a request the call gets the time left until its deadline as HTTP
+    timeout; DeadlineExceeded is raised when nobody waits for the result anymore.
+    """
+    config = policy_config(name, config)
+    options = http_options()
+    if options is not None:
+        config = config.model_copy(update={"http_options": options})
+    return policy_model(name, default_model, text), config
+
+
+def policy_model(name: str, default_model: str, text: str = "") -> str:
+    """Model of a function by its policy, see `get_policy`."""
+    policy = get_genai_settings().policies.get(name) or GenerationPolicy()
+    if policy.short_model and len(text) < policy.short_length:
+        return policy.short_model
+    return policy.model or default_model
+
+
+def policy_config(name: str, config: GenerateContentConfig) -> GenerateContentConfig:
+    """Generation config of a function by its policy without per-call HTTP options, see `get_policy`."""
+    policy = get_genai_settings().policies.get(name) or GenerationPolicy()
+    update = {}
+    if policy.max_output_tokens is not None:
+        update["max_output_tokens"] = policy.max_output_tokens
+    if policy.thinking_budget is not None:
+        update["thinking_config"] = ThinkingConfig(thinking_budget=policy.thinking_budget)
+    return config.model_copy(update=update)
 
-    service_account_file = cfg.get("service_account_file")
-    project = cfg.get("project")
-    location = cfg.get("location", "us-central1")
 
-    if not service_account_file or not project:
+def policy_key(config: GenerateContentConfig) -> str:
+    """Cache key part of a resolved generation config, so answers of an older policy are not reused."""
+    return config.model_dump_json(exclude={"http_options"}, exclude_none=True)
+
+
+def http_options() -> Optional[HttpOptions]:
+    """Per-call HTTP options bounding the call by the request deadline, None outside requests."""
+    remaining = deadline.timeout()
+    if remaining is None:
+        return None
+    return HttpOptions(timeout=max(int(remaining * 1000), 1))
+
+
+def record_usage(name: str, model: str, resp, elapsed: float) -> None:
+    """
+    Account tokens and latency of one generation under its policy and model.
+
+    :param name: policy name.
+    :param model: model that served the request.
+    :param resp: response (or last stream chunk) carrying usage metadata.
+    :param elapsed: wall time of the call in seconds.
+    """
+    usage = getattr(resp, "usage_metadata", None)
+    current = {"calls": 1, "promptTokens": 0, "outputTokens": 0, "thoughtsTokens": 0, "seconds": elapsed}
+    if usage is not None:
+        current["promptTokens"] = usage.prompt_token_count or 0
+        current["outputTokens"] = usage.candidates_token_count or 0
+        current["thoughtsTokens"] = usage.thoughts_token_count or 0
+    stats = usage_stats.setdefault(name, {}).setdefault(model, dict.fromkeys(current, 0))
+    scope = usage_scope.get()
+    for key, value in current.items():
+        stats[key] += value
+        if scope is not None:
+            scope[key] = scope.get(key, 0) + value
+
+
+@lru_cache()
+def get_genai_credentials() -> service_account.Credentials:
+    settings = get_genai_settings()
+
+    if not settings.service_account_file or not settings.project:
         raise RuntimeError("genai config is incomplete (service_account_file/project)")
 
-    creds = service_account.Credentials.from_service_account_file(
-        service_account_file,
+    return service_account.Credentials.from_service_account_file(
+        settings.service_account_file,
         scopes=["https://www.googleapis.com/auth/cloud-platform"],
     )
 
-    client = genai.Client(
-        vertexai=True,
-        credentials=creds,
-        project=project,
-        location=location,
+
+def get_http_options(settings: GenaiSettings) -> HttpOptions:
+    """
+    Shared transport options for the sync and async httpx pools of the client.
+
+    HTTP/2 is requested only when the optional `h2` package is importable,
+    otherwise httpx would refuse to build the client.
+    """
+    args = {
+        "http2": settings.http2 and importlib.util.find_spec("h2") is not None,
+        "limits": httpx.Limits(
+            max_connections=settings.pool_size,
+            max_keepalive_connections=settings.pool_keepalive,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+    }
+    return HttpOptions(client_args=args, async_client_args=dict(args))
+
+
+@lru_cache()
+def get_scheduler() -> Scheduler:
+    """Admission of upstream calls of the process by traffic class, see `modules.scheduler`."""
+    return Scheduler(get_genai_settings().scheduler)
+
+
+@lru_cache()
+def get_genai_client() -> genai.Client:
+    settings = get_genai_settings()
+
+    # replayed responses need neither credentials nor network
+    cassette = None
+    if settings.cassette.mode:
+        path = settings.cassette.path.replace("{cache}", system.path.cache)
+        cassette = Cassette(path, settings.cassette.mode, settings.cassette.latency, settings.cassette.latency_scale)
+
+    if cassette and cassette.mode == "replay":
+        client = CassetteClient(None, cassette)
+    else:
+        client = genai.Client(
+            vertexai=True,
+            credentials=get_genai_credentials(),
+            project=settings.project,
+            location=settings.location,
+            http_options=get_http_options(settings),
+        )
+        if cassette:
+            client = CassetteClient(client, cassette)
+
+    # interactive calls are admitted ahead of batch jobs and cache refreshes
+    return ScheduledClient(client, get_scheduler()) if settings.scheduler.enabled else client
+
+
+def refresh_genai_credentials() -> float:
+    """
+    Refresh the service-account token when it is missing or about to expire.
+
+    Returns the number of seconds until the next refresh is due, so the caller
+    can sleep exactly that long.
+    """
+    settings = get_genai_settings()
+    creds = get_genai_credentials()
+
+    def expires_in() -> float:
+        if not creds.expiry:
+            return 0.0
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds()
+
+    if not creds.token or expires_in() <= settings.refresh_margin:
+        creds.refresh(AuthRequest())
+        readiness["refreshed"] = datetime.now(timezone.utc).isoformat()
+
+    return max(expires_in() - settings.refresh_margin, settings.warmup_retry)
+
+
+async def warmup_genai_client() -> None:
+    """
+    Build the client and open pooled connections ahead of the first request.
+
+    A metadata lookup of the configured models costs no tokens but performs
+    the TLS handshakes for both the sync and the async transports.
+    """
+    settings = get_genai_settings()
+    client = await asyncio.to_thread(get_genai_client)
+    models = {settings.extract_model, settings.geocode_model}
+    for policy in settings.policies.values():
+        models |= {policy.model, policy.short_model} - {None}
+    for model in models:
+        await asyncio.to_thread(client.models.get, model=model)
+        await client.aio.models.get(model=model)
+
+
+async def keep_warm() -> None:
+    """Warm up once, then keep credentials refreshed ahead of expiry."""
+    settings = get_genai_settings()
+    delay = 0.0
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            delay = await asyncio.to_thread(refresh_genai_credentials)
+            if not readiness["ready"]:
+                await warmup_genai_client()
+                readiness["ready"] = True
+                system.logger.info("genai client is warm")
+            readiness["error"] = None
+        except Exception as e:  # noqa: BLE001
+            readiness["error"] = str(e)
+            system.logger.warning(f"genai warmup error: {e}")
+            delay = settings.warmup_retry
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    """Worker lifespan hook: pre-warm the client and run the credentials refresher."""
+    task = None
+    settings = get_genai_settings()
+    # replayed responses need no credentials to refresh
+    if settings.warmup and settings.cassette.mode != "replay":
+        task = asyncio.create_task(keep_warm())
+    else:
+        readiness["ready"] = True
+    try:
+        yield
+    finally:
+        if task:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+
+def embed_text(text: str) -> List[float]:
+    """Embed text with the Vertex embedding model of [genai.semantic]."""
+    settings = get_genai_settings().semantic
+    started = time.perf_counter()
+    resp = get_genai_client().models.embed_content(
+        model=settings.model,
+        contents=text,
+        config=EmbedContentConfig(
+            task_type="SEMANTIC_SIMILARITY", output_dimensionality=settings.dimensions, http_options=http_options()),
     )
+    record_usage("embed", settings.model, None, time.perf_counter() - started)
+    return normalize(resp.embeddings[0].values)
 
-    return client
+
+@lru_cache()
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Semantic cache of extraction outputs, None when disabled in [genai.semantic]."""
+    settings = get_genai_settings().semantic
+    if not settings.enabled:
+        return None
+    if settings.embedder == "local":
+        return SemanticCache(settings, HashingEmbedder(settings.dimensions))
+    if settings.embedder == "vertex":
+        return SemanticCache(settings, embed_text)
+    raise RuntimeError(f"Unsupported semantic cache embedder {settings.embedder}")
 
 
 class UserProfile(BaseModel):
@@ -91,6 +419,84 @@ VALUE_TO_ID = {'Artefact': 1, 'Square': 2, 'Cascade Complex': 3, 'Museum': 4, 'T
                'Onsen': 143, 'Day Spa': 144}
 
 VALUE_ENUM: List[str] = list(VALUE_TO_ID.keys())
+ID_TO_VALUE: Dict[int, str] = {v_id: v for v, v_id in VALUE_TO_ID.items()}
+
+generic_detector = fastpath.GenericDetector(VALUE_ENUM)
+
+
+def lenient(value: Any, handler: ValidatorFunctionWrapHandler) -> Any:
+    """Invalid optional values degrade to None instead of failing the whole response."""
+    try:
+        return handler(value)
+    except ValidationError:
+        return None
+
+
+def listed(value: Any) -> Any:
+    return value or []
+
+
+class ExtractOutput(BaseModel):
+    """Raw extraction output of the model, decoded and validated in one pass."""
+    travelMode: Annotated[Optional[Literal["walk", "car", "bike", "public_transport"]], WrapValidator(lenient)] = None
+    budgetPreference: Annotated[Optional[int], Field(ge=1, le=5), WrapValidator(lenient)] = None
+    crowdPreference: Annotated[Optional[int], Field(ge=1, le=3), WrapValidator(lenient)] = None
+    hiddenGemPreference: Annotated[Optional[int], Field(ge=1, le=3), WrapValidator(lenient)] = None
+    entityTypeValues: Annotated[List[str], BeforeValidator(listed)] = Field(default_factory=list)
+    excludedEntityTypeValues: Annotated[List[str], BeforeValidator(listed)] = Field(default_factory=list)
+    notes: Annotated[str, BeforeValidator(lambda value: (value or "").strip())] = ""
+    resetTravelMode: Annotated[bool, BeforeValidator(bool)] = False
+    resetBudgetPreference: Annotated[bool, BeforeValidator(bool)] = False
+    resetEntityTypeValues: Annotated[bool, BeforeValidator(bool)] = False
+    replaceEntityTypeValues: Annotated[bool, BeforeValidator(lambda value: value is True)] = False
+
+
+class GeocodeCandidate(BaseModel):
+    """One of the ranked locations a query may refer to, see `geocode_candidates`."""
+    standardizedQuery: str = ""
+    resolvedName: str = ""
+    countryCode: str | None = None
+    region: Annotated[str, BeforeValidator(lambda value: value or "")] = ""
+    city: Annotated[str, BeforeValidator(lambda value: value or "")] = ""
+    lat: Annotated[Optional[float], Field(ge=-90, le=90), WrapValidator(lenient)] = None
+    lon: Annotated[Optional[float], Field(ge=-180, le=180), WrapValidator(lenient)] = None
+    confidence: Annotated[float, Field(ge=0, le=1), WrapValidator(lenient)] = 0.0
+    notes: str = ""
+
+
+class GeocodeResponse(BaseModel):
+    standardizedQuery: str = ""
+    resolvedName: str = ""
+    countryCode: str | None = None
+    lat: Annotated[Optional[float], Field(ge=-90, le=90), WrapValidator(lenient)] = None
+    lon: Annotated[Optional[float], Field(ge=-180, le=180), WrapValidator(lenient)] = None
+    sourceUrls: Annotated[list[str], BeforeValidator(listed)] = []
+    notes: Annotated[str, BeforeValidator(lambda value: value or "")] = ""
+    localizedNotes: Dict[str, str] = Field(default_factory=dict)
+    candidates: List[GeocodeCandidate] = Field(default_factory=list)
+
+
+def response_text(resp) -> str:
+    """Join text parts of the first candidate."""
+    candidates = getattr(resp, "candidates", None) or []
+    if not candidates or not candidates[0].content:
+        return ""
+    parts = candidates[0].content.parts or []
+    return "".join(p.text for p in parts if getattr(p, "text", None)).strip()
+
+
+def parse_output(model: type, raw: str):
+    """
+    Decode and validate model output in a single pydantic-core pass.
+
+    Broken or empty output yields the model defaults, same as an empty object.
+    """
+    try:
+        return model.model_validate_json(raw or "{}")
+    except ValidationError as e:
+        system.logger.warning(f"{model.__name__} parse error: {e}")
+        return model()
+
 
 profile_schema = Schema(
     type=Type.OBJECT,
@@ -178,6 +584,17 @@ def extract_full_profile(text: str, locale: str, return_values: bool = False) ->
         but log the conflict.
     """
 
+    # trivially classifiable messages are served by the local extractor without the LLM
+    settings = get_genai_settings()
+    local = None
+    if settings.fastpath:
+        started = time.perf_counter()
+        local = fastpath.extract(text)
+        if local.confidence >= settings.fastpath_threshold:
+            record_usage("extract", "local", None, time.perf_counter() - started)
+            output = ExtractOutput(**local.model_dump(exclude={"confidence"}))
+            return {**delta_from_output(output, return_values), "source": "local"}
+
     taxonomy_text = "\n".join(f"- {v}" for v in VALUE_ENUM)
 
     instruction = (
@@ -233,9 +650,50 @@ def extract_full_profile(text: str, locale: str, return_values: bool = False) ->
         "- Return a single valid JSON object only, with no extra text."
     )
 
-    client = get_genai_client()
     cfg = getattr(system.settings, "genai", {})
-    model_name = cfg.get("extract_model", "gemini-2.5-flash")
+    model_name, config = get_policy("extract", EXTRACT_CFG, cfg.get("extract_model", "gemini-2.5-flash"), text)
+
+    # paraphrases of an already extracted text in the same locale reuse its output
+    semantic, reused, vector = get_semantic_cache(), None, None
+    if semantic is not None:
+        try:
+            reused, vector, _ = semantic.get(text, locale)
+        except Exception as e:  # noqa: BLE001
+            system.logger.warning(f"semantic cache error: {e}")
+            semantic = None
+        if reused is not None and not semantic.verify():
+            return {**delta_from_output(ExtractOutput(**reused), return_values), "source": "semantic"}
+
+    # the prompt does not depend on locale, so cached deltas are shared between locales
+    cache = get_cache("extract")
+    key = cache_key("raw", model_name, policy_key(config), instruction, text)
+    raw = cache.get(key)
+    if raw is None:
+        batcher = get_extract_batcher()
+        if batcher is not None:
+            raw = batcher.submit(model_name, config, instruction, text)
+        else:
+            raw = generate_extraction(model_name, config, instruction, text)
+        if raw:
+            cache.set(key, raw)
+
+    output = parse_output(ExtractOutput, raw)
+    if semantic is not None:
+        if reused is not None:
+            # sampled hit, measure drift of reuse; generated notes wording is not compared
+            semantic.compare(
+                ExtractOutput(**reused).model_dump(exclude={"notes"}), output.model_dump(exclude={"notes"}))
+        else:
+            semantic.set(text, locale, vector, output.model_dump())
+    if local is not None and settings.fastpath_log:
+        fastpath.log(settings.fastpath_log, text, local, output.model_dump())
+    return {**delta_from_output(output, return_values), "source": "llm"}
+
+
+def generate_extraction(model_name: str, config: GenerateContentConfig, instruction: str, text: str) -> str:
+    """Run a single extraction call, returns raw model output."""
+    client = get_genai_client()
+    started = time.perf_counter()
     resp = client.models.generate_content(
         model=model_name,
         contents=[
@@ -247,41 +705,189 @@ def extract_full_profile(text: str, locale: str, return_values: bool = False) ->
                 ],
             )
         ],
-        config=EXTRACT_CFG,
+        config=config,
     )
+    record_usage("extract", model_name, resp, time.perf_counter() - started)
+    return response_text(resp)
 
+
+batch_schema = Schema(
+    type=Type.OBJECT,
+    properties={
+        "items": Schema(
+            type=Type.ARRAY,
+            items=Schema(
+                type=Type.OBJECT,
+                properties={"id": Schema(type=Type.STRING), **profile_schema.properties},
+                required=["id"],
+            ),
+        ),
+    },
+    required=["items"],
+)
+
+
+class BatchItem(ExtractOutput):
+    id: str
+
+
+class BatchOutput(BaseModel):
+    items: List[BatchItem] = Field(default_factory=list)
+
+
+def generate_batch(
+        model_name: str, config: GenerateContentConfig, instruction: str, texts: List[str]
+) -> Dict[str, str]:
+    """
+    Run one extraction call for several texts, returns raw output per text index.
+
+    Items are keyed by their index as string; items the model skipped or
+    returned broken are missing from the result.
+    """
+    update = {"response_schema": batch_schema}
+    # texts waited in the batcher queue, bound the call by the deadline left now
+    options = http_options()
+    if options is not None:
+        update["http_options"] = options
+    if config.max_output_tokens:
+        update["max_output_tokens"] = config.max_output_tokens * len(texts)
+    parts = [
+        Part(text=instruction),
+        Part(text=(
+            "Several independent user texts follow, each with its id. Extract a separate profile for every text, "
+            "using only that text, and return an object with an `items` array holding exactly one profile "
+            "per id, with its `id` field set."
+        )),
+    ]
+    parts += [Part(text=f"User text {index}: {text}") for index, text in enumerate(texts)]
+
+    client = get_genai_client()
+    started = time.perf_counter()
+    resp = client.models.generate_content(
+        model=model_name,
+        contents=[Content(role="user", parts=parts)],
+        config=config.model_copy(update=update),
+    )
+    record_usage("extract:batch", model_name, resp, time.perf_counter() - started)
     try:
-        parts = resp.candidates[0].content.parts
-        raw = "".join(p.text for p in parts if getattr(p, "text", None))
-        data = json.loads(raw) if raw else {}
-    except Exception as e:
-        print("extract_full_profile parse error:", e)
-        data = {}
+        output = BatchOutput.model_validate_json(response_text(resp) or "{}")
+    except ValidationError as e:
+        system.logger.warning(f"extraction batch parse error: {e}")
+        return {}
+    return {item.id: item.model_dump_json(exclude={"id"}) for item in output.items}
+
+
+class ExtractBatcher:
+    """
+    Coalesce concurrent extraction calls into batched generate_content calls.
+
+    Callers block in `submit` (they run in worker threads); a collector thread
+    drains the queue for up to `max_wait` ms or `max_size` texts, groups them
+    by model, policy and traffic class and hands every group to the executor, so the
+    next batch is collected while the previous one is in flight. Calls run
+    in the context of their callers (deadline, traffic class, usage scope);
+    a batched call takes the context of its first caller and its usage is
+    split evenly between the scopes of all callers. Without `fallback` a
+    failed batch fails every caller with its error.
+
+    :param settings: batch settings.
+    """
+    def __init__(self, settings: BatchSettings):
+        self.settings = settings
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(settings.concurrency, thread_name_prefix="extract-batch")
+        self.thread = threading.Thread(target=self.collect, name="extract-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, model_name: str, config: GenerateContentConfig, instruction: str, text: str) -> str:
+        """Queue text for extraction and wait for its raw output."""
+        future = Future()
+        self.queue.put((model_name, config, instruction, text, future, contextvars.copy_context()))
+        return future.result()
+
+    def collect(self):
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.settings.max_wait / 1000
+            while len(items) < self.settings.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            groups = {}
+            for item in items:
+                key = (item[0], policy_key(item[1]), item[5].get(traffic, traffic.get()))
+                groups.setdefault(key, []).append(item)
+            for group in groups.values():
+                self.executor.submit(self.run, group)
+
+    def run(self, items: list):
+        model_name, config, instruction = items[0][:3]
+        outputs, error = {}, None
+        if len(items) > 1:
+            context, usage = items[0][5].copy(), {}
+            context.run(usage_scope.set, usage)
+            try:
+                outputs = context.run(generate_batch, model_name, config, instruction, [item[3] for item in items])
+            except Exception as e:  # noqa: BLE001
+                system.logger.warning(f"extraction batch error: {e}")
+                error = e
+            for item in items:
+                scope = item[5].get(usage_scope)
+                if scope is not None:
+                    for key, value in usage.items():
+                        scope[key] = scope.get(key, 0) + value / len(items)
+        for index, (_, _, _, text, future, context) in enumerate(items):
+            raw = outputs.get(str(index))
+            if raw is None and not (len(items) == 1 or self.settings.fallback):
+                future.set_exception(error or RuntimeError("extraction batch returned no output for the text"))
+                continue
+            if raw is None:
+                try:
+                    raw = context.run(generate_extraction, model_name, config, instruction, text)
+                except Exception as e:  # noqa: BLE001
+                    future.set_exception(e)
+                    continue
+            future.set_result(raw or "")
+
+
+batcher_lock = threading.Lock()
+
+
+def get_extract_batcher() -> Optional[ExtractBatcher]:
+    """Extraction batcher of the process, None when disabled in [genai.batch]."""
+    # first callers race from worker threads, there must be exactly one collector
+    with batcher_lock:
+        return create_extract_batcher()
 
-    travelMode = data.get("travelMode")
-    budgetPreference = data.get("budgetPreference")
-    crowdPreference = data.get("crowdPreference")
-    hiddenGemPreference = data.get("hiddenGemPreference")
-    notes = (data.get("notes") or "").strip()
 
-    resetTravelMode = data.get("resetTravelMode")
-    resetBudgetPreference = data.get("resetBudgetPreference")
-    resetEntityTypeValues = data.get("resetEntityTypeValues")
+@lru_cache()
+def create_extract_batcher() -> Optional[ExtractBatcher]:
+    settings = get_genai_settings().batch
+    return ExtractBatcher(settings) if settings.enabled else None
+
 
-    like_values = data.get("entityTypeValues") or []
-    dislike_values = data.get("excludedEntityTypeValues") or []
+def delta_from_output(output: "ExtractOutput", return_values: bool = False) -> dict:
+    """
+    Turn validated extraction output into a profile delta.
 
+    Values are mapped to numeric IDs via VALUE_TO_ID; if the same value
+    appears in both lists, it is treated as DISLIKED (exclude wins).
+    """
     recognized_like_ids = set()
     recognized_dislike_ids = set()
 
-    for v in like_values:
+    for v in output.entityTypeValues:
         if v in VALUE_TO_ID:
             recognized_like_ids.add(VALUE_TO_ID[v])
         else:
             if v:
                 print(f"[unknown like Value] {v!r}")
 
-    for v in dislike_values:
+    for v in output.excludedEntityTypeValues:
         if v in VALUE_TO_ID:
             recognized_dislike_ids.add(VALUE_TO_ID[v])
         else:
@@ -295,38 +901,24 @@ def extract_full_profile(text: str, locale: str, return_values: bool = False) ->
 
     entityTypeIds = sorted(recognized_like_ids)
     excludedEntityTypeIds = sorted(recognized_dislike_ids)
-    replace_entity_type_values = bool(data.get("replaceEntityTypeValues"))
 
     result = {
-        "travelMode": travelMode if travelMode in ["walk", "car", "bike", "public_transport"] else None,
-        "budgetPreference": (
-            int(budgetPreference)
-            if isinstance(budgetPreference, (int, float)) and 1 <= int(budgetPreference) <= 5
-            else None
-        ),
-        "crowdPreference": (
-            int(crowdPreference)
-            if isinstance(crowdPreference, (int, float)) and 1 <= int(crowdPreference) <= 3
-            else None
-        ),
-        "hiddenGemPreference": (
-            int(hiddenGemPreference)
-            if isinstance(hiddenGemPreference, (int, float)) and 1 <= int(hiddenGemPreference) <= 3
-            else None
-        ),
+        "travelMode": output.travelMode,
+        "budgetPreference": output.budgetPreference,
+        "crowdPreference": output.crowdPreference,
+        "hiddenGemPreference": output.hiddenGemPreference,
         "entityTypeIds": entityTypeIds,
         "excludedEntityTypeIds": excludedEntityTypeIds,
-        "notes": notes,
-        "resetTravelMode": bool(resetTravelMode),
-        "resetBudgetPreference": bool(resetBudgetPreference),
-        "resetEntityTypeValues": bool(resetEntityTypeValues),
-        "replaceEntityTypeValues": replace_entity_type_values,
+        "notes": output.notes,
+        "resetTravelMode": output.resetTravelMode,
+        "resetBudgetPreference": output.resetBudgetPreference,
+        "resetEntityTypeValues": output.resetEntityTypeValues,
+        "replaceEntityTypeValues": output.replaceEntityTypeValues,
     }
 
     if return_values:
-        inv_map = {v_id: v for v, v_id in VALUE_TO_ID.items()}
-        result["entityTypeValues"] = [inv_map[i] for i in entityTypeIds]
-        result["excludedEntityTypeValues"] = [inv_map[i] for i in excludedEntityTypeIds]
+        result["entityTypeValues"] = [ID_TO_VALUE[i] for i in entityTypeIds]
+        result["excludedEntityTypeValues"] = [ID_TO_VALUE[i] for i in excludedEntityTypeIds]
     return result
 
 
@@ -371,7 +963,18 @@ def apply_profile_delta(state: UserProfile, delta: dict) -> UserProfile:
     Returns:
         A new UserProfile instance with all updates applied.
     """
-    data = state.model_dump()
+    return UserProfile(**fold_delta(state.model_dump(), delta))
+
+
+def fold_delta(data: dict, delta: dict) -> dict:
+    """
+    Merge a delta into a plain profile dict, see `apply_profile_delta` for the rules.
+
+    Works on dicts only (no model validation), so replaying long delta logs
+    folds them one after another without per-step pydantic overhead.
+    The passed dict is not modified, a merged copy is returned.
+    """
+    data = dict(data)
 
     if delta.get("resetTravelMode"):
         data["travelMode"] = None
@@ -445,23 +1048,22 @@ def apply_profile_delta(state: UserProfile, delta: dict) -> UserProfile:
     if new_notes:
         data["notes"] = new_notes
 
-    inv_map = {v_id: v for v, v_id in VALUE_TO_ID.items()}
-    data["entityTypeValues"] = [inv_map[i] for i in data["entityTypeIds"] if i in inv_map]
+    data["entityTypeValues"] = [ID_TO_VALUE[i] for i in data["entityTypeIds"] if i in ID_TO_VALUE]
     data["excludedEntityTypeValues"] = [
-        inv_map[i] for i in data["excludedEntityTypeIds"] if i in inv_map
+        ID_TO_VALUE[i] for i in data["excludedEntityTypeIds"] if i in ID_TO_VALUE
     ]
-    return UserProfile(**data)
+    return data
 
-def generate_notes_from_profile(state: UserProfile, locale: str = "en") -> str:
-    """
-    Generates a human-readable notes summary based on the current user profile.
-    Operates on an already assembled UserProfile rather than raw input text.
-    """
+NOTES_CFG = GenerateContentConfig(
+    temperature=0.5,
+    top_p=0.8,
+    candidate_count=1,
+    response_mime_type="text/plain",
+)
 
-    client = get_genai_client()
-    cfg = getattr(system.settings, "genai", {})
-    model_name = cfg.get("extract_model", "gemini-2.5-flash")
 
+def notes_prompt(state: UserProfile, locale: str = "en") -> str:
+    """Build the notes summarization prompt for an assembled profile."""
     inv_map = {v_id: v for v, v_id in VALUE_TO_ID.items()}
     like_values = [
         inv_map[i] for i in state.entityTypeIds if i in inv_map
@@ -510,17 +1112,28 @@ def generate_notes_from_profile(state: UserProfile, locale: str = "en") -> str:
     {profile_json}
     """.strip()
 
+    return prompt
+
+
+def generate_notes_from_profile(state: UserProfile, locale: str = "en") -> str:
+    """
+    Generates a human-readable notes summary based on the current user profile.
+    Operates on an already assembled UserProfile rather than raw input text.
+    """
+
+    client = get_genai_client()
+    cfg = getattr(system.settings, "genai", {})
+    prompt = notes_prompt(state, locale)
+    model_name, config = get_policy("notes", NOTES_CFG, cfg.get("extract_model", "gemini-2.5-flash"), prompt)
+
     try:
+        started = time.perf_counter()
         resp = client.models.generate_content(
             model=model_name,
             contents=[Content(role="user", parts=[Part(text=prompt)])],
-            config=GenerateContentConfig(
-                temperature=0.5,
-                top_p=0.8,
-                candidate_count=1,
-                response_mime_type="text/plain",
-            ),
+            config=config,
         )
+        record_usage("notes", model_name, resp, time.perf_counter() - started)
 
         parts = resp.candidates[0].content.parts
         text = "".join(getattr(p, "text", "") for p in parts if getattr(p, "text", None))
@@ -531,6 +1144,49 @@ def generate_notes_from_profile(state: UserProfile, locale: str = "en") -> str:
         return (state.notes or "").strip()
 
 
+async def stream_notes_from_profile(state: UserProfile, locale: str = "en") -> AsyncIterator[str]:
+    """
+    Streaming variant of `generate_notes_from_profile`.
+
+    Yields text chunks as the model produces them, so the caller can forward
+    them before the summary is complete. Same prompt and config, so the token
+    cost does not change. When the model fails before the first chunk, the
+    existing notes are yielded instead; a failure mid-stream ends the stream
+    with what was already produced.
+    """
+    cfg = getattr(system.settings, "genai", {})
+    prompt = notes_prompt(state, locale)
+    model_name, config = get_policy("notes", NOTES_CFG, cfg.get("extract_model", "gemini-2.5-flash"), prompt)
+
+    started = False
+    begin = time.perf_counter()
+    chunk = None
+    try:
+        client = await asyncio.to_thread(get_genai_client)
+        stream = await client.aio.models.generate_content_stream(
+            model=model_name,
+            contents=[Content(role="user", parts=[Part(text=prompt)])],
+            config=config,
+        )
+        async for chunk in stream:
+            text = chunk.text if chunk.candidates else None
+            if text:
+                # leading whitespace of the whole message is dropped, like strip() does
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                started = True
+                yield text
+        # usage metadata of the last chunk covers the whole stream
+        record_usage("notes", model_name, chunk, time.perf_counter() - begin)
+
+    except Exception as e:  # noqa: BLE001
+        system.logger.exception(f"stream_notes_from_profile error: {e}")
+        if not started and state.notes:
+            yield state.notes.strip()
+
+
 def update_profile_from_text(
     text: str,
     locale: str,
@@ -556,10 +1212,26 @@ def update_profile_from_text(
         (new_state, delta) — the updated UserProfile and the extracted delta dictionary.
     """
 
+    new_state, delta = merge_profile_from_text(text, locale, state, return_values)
+    new_state.notes = generate_notes_from_profile(new_state, locale=locale)
+
+    return new_state, delta
+
+
+def merge_profile_from_text(
+    text: str,
+    locale: str,
+    state: UserProfile,
+    return_values: bool = False,
+) -> tuple[UserProfile, dict]:
+    """
+    Extract and apply the delta of `update_profile_from_text` without regenerating notes.
+
+    Lets the notes be produced separately, eg. streamed to the client while
+    the model writes them. Empty `text` returns the unchanged state and an empty delta.
+    """
     if not text or not text.strip():
-        new_state = state
-        new_state.notes = generate_notes_from_profile(new_state, locale=locale)
-        return new_state, {}
+        return state, {}
 
     delta = extract_full_profile(text, locale=locale, return_values=return_values)
     new_state = apply_profile_delta(state, delta)
@@ -577,8 +1249,6 @@ def update_profile_from_text(
         new_state.entityTypeValues = []
         new_state.excludedEntityTypeValues = []
 
-    new_state.notes = generate_notes_from_profile(new_state, locale=locale)
-
     return new_state, delta
 
 
@@ -591,11 +1261,9 @@ geocode_schema = {
         "countryCode": {"type": "STRING", "nullable": True},
         "lat": {"type": "NUMBER", "nullable": True},
         "lon": {"type": "NUMBER", "nullable": True},
-        "sourceUrls": {
-            "type": "ARRAY",
-            "items": {"type": "STRING"},
-        },
-        "notes": {"type": "STRING"},
+        "city": {"type": "STRING"},
+        "confidence": {"type": "NUMBER"},
+        "ambiguous": {"type": "BOOLEAN"},
     },
 }
 
@@ -607,81 +1275,131 @@ GEOCODE_CFG = GenerateContentConfig(
     candidate_count=1,
     seed=7,
     response_schema=geocode_schema,
-    # tools=[Tool(google_search=GoogleSearch())]
 )
 
-def geocode_with_gemini(place_query: str, locale: str = "en") -> Dict[str, Any]:
-    """
-    Resolve a free-form place query to a structured geocoding result using Gemini.
+# search grounding does not combine with a response schema, JSON is requested by the prompt
+GROUNDED_GEOCODE_CFG = GenerateContentConfig(
+    temperature=0.0,
+    top_p=1.0,
+    candidate_count=1,
+    seed=7,
+    tools=[Tool(google_search=GoogleSearch())],
+)
 
-    The function sends a carefully constrained prompt to a Gemini model configured
-    for geocoding and web-grounded lookup. The model is instructed to:
-      - Interpret the user query, normalize it in English and decide whether it
-        refers to a specific place or only to a generic type of place.
-      - For generic queries, return a “no coordinates” result with
-        lat = null, lon = null, notes = "" and an empty sourceUrls list.
-      - For specific places, use web search to identify one real location, choose
-        a canonical name, and return its coordinates, ISO country code and a small
-        set of source URLs.
-      - Produce a locale-aware human-readable notes field when coordinates are known
-        (e.g. "<city>, <country>" translated to the target locale).
+LOCALIZE_CFG = GenerateContentConfig(
+    temperature=0.0,
+    response_mime_type="application/json",
+    top_p=1.0,
+    candidate_count=1,
+    seed=7,
+    response_schema=Schema(
+        type=Type.OBJECT,
+        properties={"names": Schema(type=Type.ARRAY, items=Schema(type=Type.STRING))},
+        required=["names"],
+    ),
+)
 
-    On success, returns a dict compatible with GeocodeResponse:
-        {
-          "standardizedQuery": str,
-          "resolvedName": str,
-          "countryCode": str | None,
-          "lat": float | None,
-          "lon": float | None,
-          "sourceUrls": list[str],
-          "notes": str,
-        }
+CANDIDATES_CFG = GenerateContentConfig(
+    temperature=0.0,
+    response_mime_type="application/json",
+    top_p=1.0,
+    candidate_count=1,
+    seed=7,
+    response_schema={
+        "type": "OBJECT",
+        "properties": {
+            "candidates": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "standardizedQuery": {"type": "STRING"},
+                        "resolvedName": {"type": "STRING"},
+                        "countryCode": {"type": "STRING", "nullable": True},
+                        "region": {"type": "STRING"},
+                        "city": {"type": "STRING"},
+                        "lat": {"type": "NUMBER"},
+                        "lon": {"type": "NUMBER"},
+                        "confidence": {"type": "NUMBER"},
+                    },
+                },
+            },
+        },
+    },
+)
 
-    On any error (model failure, parsing issues, empty response), logs the exception
-    and returns an error dict:
-        {
-          "error": "...",
-          "input_query": place_query,
-        }
+# words tying a place name to its context, eg. "Springfield in Illinois"
+CONTEXT_STOPWORDS = {"in", "near", "at", "of", "the", "city", "state", "country", "в", "на", "около", "город"}
+
+# which tier served the final geocode answer, see `geocode_with_gemini`
+geocode_tiers = {"generic": 0, "disambiguated": 0, "candidates": 0, "fast": 0, "grounded": 0, "failed": 0}
+
+
+class GeocodeCore(GeocodeResponse):
+    """Locale independent geocode result, cached once for all locales; notes are rendered per locale."""
+    city: Annotated[str, BeforeValidator(lambda value: value or "")] = ""
+
+
+class GeocodeDraft(GeocodeCore):
+    """Ungrounded geocode answer with the model's own confidence."""
+    confidence: Annotated[float, Field(ge=0, le=1), WrapValidator(lenient)] = 0.0
+    ambiguous: Annotated[bool, BeforeValidator(bool)] = False
+
+
+def geocode_prompt(place_query: str, grounded: bool) -> str:
     """
-    client = get_genai_client()
-    cfg = getattr(system.settings, "genai", {})
-    model_name = cfg.get("geocode_model", "gemini-2.5-flash")
+    Build the geocoding prompt.
 
-    prompt = f"""
+    The ungrounded variant asks for coordinates from the model's knowledge plus
+    a self-reported confidence; the grounded one asks to verify with web search.
+    The answer is in English only, so it does not depend on the request locale.
+    """
+    if grounded:
+        specific = """
+    4) For specific places:
+       • Always use web search to identify one real location and its coordinates. Do not rely on memorized knowledge.
+       • Use reliable sources such as Wikipedia, web maps, encyclopedias or official portals.
+       • If several locations share the same name:
+           – If the query text clearly indicates a country, region or city, follow that.
+           – Otherwise prefer the internationally well-known tourist destination.
+       • Based on the English interpretation and web search, construct a concise standardizedQuery in English and choose a clear official name for resolvedName."""
+        fields = ""
+    else:
+        specific = """
+    4) For specific places:
+       • Identify one real location and its coordinates from your own knowledge.
+       • If several locations share the same name:
+           – If the query text clearly indicates a country, region or city, follow that.
+           – Otherwise prefer the internationally well-known tourist destination, and set ambiguous=true.
+       • Construct a concise standardizedQuery in English and choose a clear official name for resolvedName.
+       • Set confidence in [0, 1] to how sure you are that the coordinates are within 1 km of the place.
+         Use a low confidence for small, obscure, recently built or renamed places.
+       • For generic queries set confidence=1 and ambiguous=false."""
+        fields = """
+           "confidence": number,
+           "ambiguous": boolean,"""
+
+    return f"""
     You are a geocoding assistant for a tourist application.
 
     Input place query: "{place_query}"
-    Target locale: "{locale}"
 
     Your task:
 
-    1) First, internally translate the input query into English. Use ONLY the English version for normalization and web search. The translation step is internal and must not appear in the JSON output.
+    1) First, internally translate the input query into English. Use ONLY the English version for normalization{" and web search" if grounded else ""}. The translation step is internal and must not appear in the JSON output.
 
     2) Decide whether the query refers to one specific identifiable place or only to a general category of place. You may use both direct and clear indirect cues, but do not force a specific place when the meaning remains ambiguous and no single real location is strongly indicated.
 
     3) For generic queries:
        • Do not try to guess a specific location.
-       • Do not perform targeted web search for coordinates.
-       • Set lat=null, lon=null, notes="", sourceUrls=[] and still return a valid JSON object.
+       • Do not {"perform targeted web search" if grounded else "look up"} coordinates.
+       • Set lat=null, lon=null, city="" and still return a valid JSON object.
+{specific}
 
-    4) For specific places:
-       • Always use web search to identify one real location and its coordinates. Do not rely on memorized knowledge.
-       • Use reliable sources such as Wikipedia, web maps, encyclopedias or official portals.
-       • If several locations share the same name:
-           – If the query text clearly indicates a country, region or city, follow that.
-           – Otherwise prefer the internationally well-known tourist destination.
-       • Based on the English interpretation and web search, construct a concise standardizedQuery in English and choose a clear official name for resolvedName.
-       • Provide a small list of relevant sourceUrls.
-
-    5) Filling notes:
-       • If lat or lon is null, notes must be exactly "" (empty string).
-       • If coordinates are known, notes must be in the format: "<first>, <country>".
-       • <first> must be:
-           – the city in which the place is located, when the place belongs to a city;
-           – the place name itself, when using a city is not appropriate for the location.
-       • Both <first> and <country> must be fully translated into the target locale language inferred from locale.
-       • All words in notes must be in the target locale language only. Do not keep any words in English or in any other language.
+    5) Filling city:
+       • If lat or lon is null, city must be exactly "" (empty string).
+       • Otherwise city is the English name of the city in which the place is located.
+       • Use "" when the place does not belong to a city (eg. a mountain, a national park or a city itself).
 
     6) Output format:
        • Return a single strictly valid JSON object with fields:
@@ -689,9 +1407,9 @@ def geocode_with_gemini(place_query: str, locale: str = "en") -> Dict[str, Any]:
            "resolvedName": string,
            "countryCode": string or null,
            "lat": number or null,
-           "lon": number or null,
-           "sourceUrls": array of strings,
-           "notes": string
+           "lon": number or null,{fields}
+           "city": string
+       • countryCode must be an ISO 3166-1 alpha-2 code.
        • lat must be in [-90, 90] or null.
        • lon must be in [-180, 180] or null.
        • Do not invent coordinates when they cannot be reliably determined.
@@ -700,34 +1418,504 @@ def geocode_with_gemini(place_query: str, locale: str = "en") -> Dict[str, Any]:
     Return only the JSON object.
     """.strip()
 
+
+def grounding_urls(resp) -> List[str]:
+    """Source URLs of the search results the answer was grounded on."""
+    candidates = getattr(resp, "candidates", None) or []
+    metadata = candidates[0].grounding_metadata if candidates else None
+    chunks = (metadata.grounding_chunks if metadata else None) or []
+    return list(dict.fromkeys(chunk.web.uri for chunk in chunks if chunk.web and chunk.web.uri))
+
+
+def geocode_fast(place_query: str) -> GeocodeDraft:
+    """Tier 1: ungrounded call, coordinates from model knowledge with confidence."""
+    cfg = getattr(system.settings, "genai", {})
+    model_name, config = get_policy("geocode", GEOCODE_CFG, cfg.get("geocode_model", "gemini-2.5-flash"), place_query)
+    client = get_genai_client()
+    started = time.perf_counter()
+    resp = client.models.generate_content(
+        model=model_name,
+        contents=[Content(role="user", parts=[Part(text=geocode_prompt(place_query, False))])],
+        config=config,
+    )
+    record_usage("geocode", model_name, resp, time.perf_counter() - started)
+    raw = response_text(resp)
+    if not raw:
+        raise ValueError("Empty response text from model")
+    return GeocodeDraft.model_validate_json(raw)
+
+
+def geocode_grounded(place_query: str) -> GeocodeCore:
+    """Tier 2: search-grounded call, source URLs come from grounding metadata."""
+    cfg = getattr(system.settings, "genai", {})
+    model_name, config = get_policy(
+        "geocode_grounded", GROUNDED_GEOCODE_CFG, cfg.get("geocode_model", "gemini-2.5-flash"), place_query)
+    client = get_genai_client()
+    started = time.perf_counter()
+    resp = client.models.generate_content(
+        model=model_name,
+        contents=[Content(role="user", parts=[Part(text=geocode_prompt(place_query, True))])],
+        config=config,
+    )
+    record_usage("geocode_grounded", model_name, resp, time.perf_counter() - started)
+    raw = response_text(resp)
+    # without a response schema the model may still wrap JSON in a code fence
+    raw = raw.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    if not raw:
+        raise ValueError("Empty response text from model")
+    result = GeocodeCore.model_validate_json(raw)
+    result.sourceUrls = grounding_urls(resp)
+    return result
+
+
+def candidates_prompt(place_query: str, limit: int) -> str:
+    return f"""
+    You are a geocoding assistant for a tourist application.
+
+    Input place query: "{place_query}"
+
+    Your task:
+
+    1) Internally translate the input query into English and use only the English version.
+    2) List up to {limit} real, distinct locations the query may refer to, from your own knowledge,
+       ranked from the most to the least likely for a tourist; the internationally well-known destination first.
+       A query that clearly indicates a country, region or city has a single candidate.
+    3) For every candidate:
+       • standardizedQuery: a concise English query that identifies this candidate only.
+       • resolvedName: a clear official English name.
+       • countryCode: ISO 3166-1 alpha-2 code.
+       • region: English name of the state, province or region, "" when not applicable.
+       • city: English name of the city the place is located in, "" when it does not belong to a city.
+       • lat, lon: coordinates, lat in [-90, 90], lon in [-180, 180].
+       • confidence in [0, 1]: how likely the query refers to this candidate.
+    4) For generic queries (only a category of place) return an empty list.
+
+    Return a single strictly valid JSON object {{"candidates": [...]}}.
+    """.strip()
+
+
+def geocode_candidates(place_query: str) -> List[Dict[str, Any]]:
+    """
+    Ranked candidate locations of an ambiguous query, cached per query.
+
+    Up to `geocode_candidates` of [genai] candidates are requested whatever
+    the client asks for, so the cached set also serves larger requests and
+    later disambiguated queries, see `geocode_disambiguated`.
+    """
+    settings = get_genai_settings()
+    model_name, config = get_policy(
+        "geocode_candidates", CANDIDATES_CFG, settings.geocode_model, " ".join(context_words(place_query)))
+    cache = get_cache("candidates")
+    key = candidates_key(place_query)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    client = get_genai_client()
+    started = time.perf_counter()
+    resp = client.models.generate_content(
+        model=model_name,
+        contents=[Content(role="user", parts=[
+            Part(text=candidates_prompt(place_query, settings.geocode_candidates))])],
+        config=config,
+    )
+    record_usage("geocode_candidates", model_name, resp, time.perf_counter() - started)
+    raw = response_text(resp)
+    if not raw:
+        raise ValueError("Empty response text from model")
+    candidates = [GeocodeCandidate.model_validate(item) for item in json.loads(raw).get("candidates") or []]
+    data = [
+        candidate.model_dump(exclude={"notes"}) for candidate in candidates[:settings.geocode_candidates]
+        if candidate.lat is not None and candidate.lon is not None]
+    cache.set(key, data)
+    return data
+
+
+def context_words(text: str) -> List[str]:
+    return "".join(char if char.isalnum() else " " for char in text.lower()).split()
+
+
+def candidates_key(place_query: str) -> str:
+    """
+    Cache key of the candidate set of a query, the same for storing and for disambiguated lookups.
+
+    The query is reduced to its words, so "St. Petersburg" and a lookup of
+    "st petersburg" meet; the model is selected by the same reduced text.
+    The policy is resolved without HTTP options, which need no deadline.
+    """
+    name = " ".join(context_words(place_query))
+    model_name = policy_model("geocode_candidates", get_genai_settings().geocode_model, name)
+    return cache_key(model_name, policy_key(policy_config("geocode_candidates", CANDIDATES_CFG)), name)
+
+
+def geocode_disambiguated(place_query: str) -> Optional[Dict[str, Any]]:
+    """
+    Answer a query refining an earlier candidates query from its cached candidate set.
+
+    The query is split into a name, a prefix or suffix with a cached
+    candidate set ("Springfield" of "Springfield, Illinois"), and context
+    words; exactly one candidate whose city, region or country names contain
+    all context words answers the query. None when there is no such candidate.
+    """
+    words = context_words(place_query)
+    cache = get_cache("candidates")
+    for size in range(len(words) - 1, 0, -1):
+        for name, context in ((words[:size], words[size:]), (words[-size:], words[:-size])):
+            candidates = cache.get(candidates_key(" ".join(name)))
+            context = [word for word in context if word not in CONTEXT_STOPWORDS]
+            if not candidates or not context:
+                continue
+            matches = []
+            for candidate in candidates:
+                code = (candidate.get("countryCode") or "").upper()
+                terms = [candidate.get("city"), candidate.get("region"), code]
+                terms += [names.get(code) for names in locales.get_countries().values()]
+                known = {word for term in terms if term for word in context_words(term)}
+                if all(word in known for word in context):
+                    matches.append(candidate)
+            if len(matches) == 1:
+                return GeocodeCore.model_validate(matches[0]).model_dump()
+    return None
+
+
+def generic_key(place_query: str) -> str:
+    return " ".join(place_query.lower().split())
+
+
+def geocode_generic(place_query: str) -> Optional[Dict[str, Any]]:
+    """
+    Answer pure category queries ("a cafe", "beach", "музей") without the LLM.
+
+    Queries naming a single taxonomy value, optionally with determiners, are
+    recognized locally; other queries the LLM already answered as generic are
+    remembered in the "generic" cache namespace. Either way the standard
+    "no coordinates" result is returned, None for specific queries.
+    """
+    values = generic_detector(place_query)
+    if values is not None:
+        return GeocodeCore(standardizedQuery=" and ".join(values)).model_dump()
+    return get_cache("generic").get(generic_key(place_query))
+
+
+def localize_prompt(items: List[Tuple[str, Optional[str], str]]) -> str:
+    listed_items = "\n".join(
+        f"    {number}. {name} | {code or '-'} | {locale}"
+        for number, (name, code, locale) in enumerate(items, start=1))
+    return f"""
+    Translate English place names for a tourist application into the language of the given locale.
+
+    Places (English name | ISO country code | target locale):
+{listed_items}
+
+    • Use the name commonly used for the place in that language; transliterate into its script only when there is none.
+    • Translate the name only, do not add a region or a country.
+    • Return a JSON object {{"names": [...]}} with exactly one name per line above, in the same order.
+    """.strip()
+
+
+def localize_names(places: Dict[str, List[Tuple[str, Optional[str]]]]) -> Dict[str, List[str]]:
+    """
+    Place names in the language of their target locale, English names when translation fails.
+
+    Every name is cached on its own in the "localize" namespace, so a city
+    is translated once per locale whichever place query it came from;
+    only missing names are sent to the LLM, each once and all locales in one call.
+
+    :param places: English names with the ISO code of their country (for disambiguation) by target locale.
+    """
+    cfg = getattr(system.settings, "genai", {})
+    model_name, config = get_policy("localize", LOCALIZE_CFG, cfg.get("geocode_model", "gemini-2.5-flash"))
+    prefix = localize_prefix()
+    cache = get_cache("localize")
+    result: Dict[str, List[str]] = {}
+    # cache key -> (name, code, locale) and the positions waiting for it
+    missing: Dict[str, Tuple[str, Optional[str], str]] = {}
+    waiting: Dict[str, List[Tuple[str, int]]] = {}
+    for locale, current in places.items():
+        if locales.language(locale) == "en":
+            result[locale] = [name for name, _ in current]
+            continue
+        result[locale] = []
+        for index, (name, code) in enumerate(current):
+            key = cache_key(*prefix, locales.language(locale), name, code)
+            result[locale].append(cache.get(key))
+            if result[locale][index] is None:
+                missing[key] = (name, code, locale)
+                waiting.setdefault(key, []).append((locale, index))
+    if not missing:
+        return result
+
     try:
+        client = get_genai_client()
+        started = time.perf_counter()
         resp = client.models.generate_content(
             model=model_name,
-            contents=[Content(role="user", parts=[Part(text=prompt)])],
-            config=GEOCODE_CFG,
+            contents=[Content(role="user", parts=[Part(text=localize_prompt(list(missing.values())))])],
+            config=config,
         )
+        record_usage("localize", model_name, resp, time.perf_counter() - started)
+        translated = json.loads(response_text(resp) or "{}").get("names") or []
+        if len(translated) != len(missing):
+            raise ValueError(f"expected {len(missing)} names, got {len(translated)}")
+    except Exception as e:  # noqa: BLE001
+        system.logger.warning(f"localize_names error, keeping English names: {e}")
+        translated = [""] * len(missing)
+
+    for (key, (english, _, _)), name in zip(missing.items(), translated):
+        name = str(name).strip()
+        if name:
+            cache.set(key, name)
+        for locale, index in waiting[key]:
+            result[locale][index] = name or english
+    return result
+
+
+def localize_prefix() -> Tuple[str, str]:
+    """Model and policy parts of "localize" cache keys, translations of an older policy are not reused."""
+    model_name = policy_model("localize", get_genai_settings().geocode_model)
+    return model_name, policy_key(policy_config("localize", LOCALIZE_CFG))
 
-        candidates = getattr(resp, "candidates", None) or []
-        if not candidates:
-            raise ValueError("No candidates returned from model")
 
-        parts = candidates[0].content.parts
-        raw = "".join(
-            getattr(p, "text", "")
-            for p in parts
-            if getattr(p, "text", None)
-        ).strip()
+def note_places(core: Dict[str, Any], language: str) -> List[Tuple[str, Optional[str]]]:
+    """English names of a result translated for its notes: the city, then the country when it is not bundled."""
+    code = (core.get("countryCode") or "").upper() or None
+    first = core.get("city") or core.get("resolvedName") or core.get("standardizedQuery") or ""
+    places = [(first, code)] if first else []
+    if locales.country_name(code, language) is None and locales.country_name(code, "en"):
+        places.append((locales.country_name(code, "en"), code))
+    return places
 
-        if not raw:
-            raise ValueError("Empty response text from model")
 
-        data = json.loads(raw)
-        return data
+def notes_cached(cores: List[Dict[str, Any]], targets: List[str]) -> bool:
+    """Whether `geocode_notes` renders notes of the results without translating anything."""
+    cache, prefix = get_cache("localize"), localize_prefix()
+    for core in cores:
+        if core.get("lat") is None or core.get("lon") is None:
+            continue
+        for language in {locales.language(locale) for locale in targets} - {"en"}:
+            if any(cache.get(cache_key(*prefix, language, name, code)) is None
+                   for name, code in note_places(core, language)):
+                return False
+    return True
 
+
+def geocode_notes(cores: List[Dict[str, Any]], targets: List[str]) -> List[Dict[str, str]]:
+    """
+    Render "<city>, <country>" notes of geocode results in the language of every target locale.
+
+    The country comes from the bundled CLDR table (`modules.locales`), only
+    the city, or the place name for places outside cities, is translated by
+    the LLM, for all results and locales in one call; locales missing from
+    the table get the country translated too. Locales of one language
+    ("pt" and "pt-BR") share their names. Results without coordinates
+    have empty notes.
+
+    :param cores: locale independent results, see `GeocodeCore`.
+    :param targets: target locales.
+    """
+    languages = list(dict.fromkeys(locales.language(locale) for locale in targets))
+    places: Dict[str, List[Tuple[str, Optional[str]]]] = {language: [] for language in languages}
+    spans = []
+    for core in cores:
+        if core.get("lat") is None or core.get("lon") is None:
+            spans.append(None)
+            continue
+        current = {}
+        for language in languages:
+            start = len(places[language])
+            places[language] += note_places(core, language)
+            current[language] = (start, len(places[language]))
+        spans.append(((core.get("countryCode") or "").upper() or None, current))
+    names = localize_names(places)
+
+    notes = []
+    for span in spans:
+        if span is None:
+            notes.append(dict.fromkeys(targets, ""))
+            continue
+        code, current = span
+        rendered = {}
+        for locale in targets:
+            language = locales.language(locale)
+            start, end = current[language]
+            country = locales.country_name(code, language)
+            rendered[locale] = ", ".join(names[language][start:end] + ([country] if country else []))
+        notes.append(rendered)
+    return notes
+
+
+def geocode_core(place_query: str) -> Dict[str, Any]:
+    """
+    Locale independent resolution of `geocode_with_gemini`, a GeocodeCore dict.
+
+    Results are cached in the "geocode" namespace with stale-while-revalidate
+    and refresh-ahead of hot entries, see `RefreshingCache`.
+    """
+    generic = geocode_generic(place_query)
+    if generic is not None:
+        geocode_tiers["generic"] += 1
+        return generic
+
+    return get_refreshing_cache("geocode").fetch(geocode_key(place_query), lambda: resolve_core(place_query))
+
+
+def geocode_key(place_query: str) -> str:
+    """
+    Cache key of the locale independent resolution of a query.
+
+    Models and policies of both tiers are part of it, so answers of an older
+    policy are neither served nor refreshed ahead.
+    """
+    model_name = get_genai_settings().geocode_model
+    return cache_key(
+        policy_model("geocode", model_name, place_query), policy_key(policy_config("geocode", GEOCODE_CFG)),
+        policy_model("geocode_grounded", model_name, place_query),
+        policy_key(policy_config("geocode_grounded", GROUNDED_GEOCODE_CFG)),
+        geocode_prompt(place_query, False))
+
+
+def geocode_cached(
+        place_query: str, locale: str = "en", targets: Optional[List[str]] = None, candidates: int = 0
+) -> bool:
+    """
+    Whether `geocode_with_gemini` answers the query without upstream calls.
+
+    Both the locale independent resolution and the translated names of its
+    notes in every requested locale must be cached; an empty candidate set
+    falls back to the single resolution, which must be cached then.
+
+    :param place_query: place query.
+    :param locale: locale of notes.
+    :param targets: locales of localizedNotes.
+    :param candidates: requested candidate locations.
+    """
+    cores = None
+    if candidates > 0:
+        cached = get_cache("candidates").get(candidates_key(place_query))
+        if cached is None:
+            return False
+        cores = cached[:candidates] or None
+    if cores is None:
+        if geocode_generic(place_query) is not None:
+            return True
+        entry = get_refreshing_cache("geocode").cache.peek(geocode_key(place_query))
+        if entry is None:
+            return False
+        cores = [entry[0]]
+    return notes_cached(cores, [locale, *(targets or [])])
+
+
+def resolve_core(place_query: str) -> Dict[str, Any]:
+    """Uncached part of `geocode_core`: candidate sets, then the model tiers."""
+    settings = get_genai_settings()
+    disambiguated = geocode_disambiguated(place_query)
+    if disambiguated is not None:
+        geocode_tiers["disambiguated"] += 1
+        return disambiguated
+
+    draft = geocode_fast(place_query)
+    result, tier = GeocodeCore.model_validate(draft.model_dump(exclude={"sourceUrls"})), "fast"
+    if settings.geocode_grounding and (draft.ambiguous or draft.confidence < settings.geocode_confidence):
+        try:
+            result, tier = geocode_grounded(place_query), "grounded"
+        except Exception as e:  # noqa: BLE001
+            system.logger.warning(f"geocode grounding error, keeping ungrounded answer: {e}")
+
+    geocode_tiers[tier] += 1
+    data = result.model_dump()
+    if result.lat is None and result.lon is None and not result.resolvedName:
+        get_cache("generic").set(generic_key(place_query), data)
+    return data
+
+
+geocode_log_lock = threading.Lock()
+
+
+def log_geocode_query(path: str, place_query: str, targets: List[str]):
+    """
+    Append geocode query to the query log, the source of `geocode:warm` command.
+
+    :param path: JSON lines file, "{logs}" is replaced with logs location.
+    :param place_query: place query.
+    :param targets: requested locales.
+    """
+    path = path.replace("{logs}", system.path.logs)
+    record = {"query": place_query, "locales": targets, "time": datetime.now(timezone.utc).isoformat()}
+    with geocode_log_lock, open(path, "a", encoding="utf-8") as handle:
+        handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def geocode_with_gemini(
+        place_query: str, locale: str = "en", targets: Optional[List[str]] = None, candidates: int = 0
+) -> Dict[str, Any]:
+    """
+    Resolve a free-form place query to a structured geocoding result using Gemini.
+
+    Resolution is tiered to pay for web search only where it matters:
+      - Tier 0: pure category queries are answered locally, see `geocode_generic`.
+      - Tier 1: a cheap ungrounded call returns coordinates from the model's
+        knowledge together with a self-reported confidence and an ambiguity flag.
+        Generic queries (only a type of place) get lat = null, lon = null
+        here and never escalate.
+      - Tier 2: results below `geocode_confidence` of [genai], or ambiguous ones,
+        are resolved again with Google Search grounding; sourceUrls are taken
+        from the grounding metadata (tier 1 answers have none).
+    When tier 2 fails, the tier 1 answer is returned. Per-tier hits are counted
+    in `geocode_tiers`, tokens and latency per tier in `usage_stats`.
+
+    With `candidates` > 0 one structured call returns up to that many ranked
+    locations instead (`geocode_candidates`); the best one fills the top level
+    fields. Cached candidate sets also answer later queries refining the name
+    with a city, region or country, see `geocode_disambiguated`.
+
+    The resolution itself does not depend on the locale and is cached once;
+    locale-aware notes ("<city>, <country>" in the target locale) are rendered
+    afterwards by `geocode_notes` when coordinates are known. Notes for
+    several locales at once are returned in localizedNotes when `targets` is given,
+    `notes` stays in `locale`.
+
+    On success, returns a dict compatible with GeocodeResponse:
+        {
+          "standardizedQuery": str,
+          "resolvedName": str,
+          "countryCode": str | None,
+          "lat": float | None,
+          "lon": float | None,
+          "sourceUrls": list[str],
+          "notes": str,
+          "localizedNotes": dict[str, str],
+          "candidates": list[dict],
+        }
+
+    On any error (model failure, parsing issues, empty response), logs the exception
+    and returns an error dict:
+        {
+          "error": "...",
+          "input_query": place_query,
+        }
+    """
+    settings = get_genai_settings()
+    if settings.geocode_log:
+        log_geocode_query(settings.geocode_log, place_query, [locale, *(targets or [])])
+
+    try:
+        ranked = []
+        if candidates > 0:
+            ranked = geocode_candidates(place_query)[:candidates]
+            geocode_tiers["candidates"] += 1
+        core = GeocodeCore.model_validate(ranked[0]).model_dump() if ranked else geocode_core(place_query)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
+        geocode_tiers["failed"] += 1
         system.logger.exception(f"geocode_with_gemini error: {e}")
         return {
             "error": f"geocoding failed: {e}",
             "input_query": place_query,
         }
-
+    requested = list(dict.fromkeys([locale, *(targets or [])]))
+    notes, *ranked_notes = geocode_notes([core, *ranked], requested)
+    localized = {target: notes[target] for target in targets or []}
+    ranked = [{**candidate, "notes": current[locale]} for candidate, current in zip(ranked, ranked_notes)]
+    return GeocodeResponse(
+        **{**core, "notes": notes[locale], "localizedNotes": localized, "candidates": ranked}).model_dump()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+from functools import lru_cache
+from typing import Dict, Optional
+
+# country names by locale and ISO 3166 code, generated from CLDR territory names
+COUNTRIES_FILE = os.path.join(os.path.dirname(__file__), "countries.json")
+
+
+@lru_cache()
+def get_countries() -> Dict[str, Dict[str, str]]:
+    with open(COUNTRIES_FILE, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def language(locale: str) -> str:
+    """Table locale for a request locale: "pt-BR" and "pt_BR" fall back to "pt"."""
+    return locale.replace("_", "-").split("-")[0].lower()
+
+
+def supported(locale: str) -> bool:
+    """Whether country names of locale are bundled."""
+    return language(locale) in get_countries()
+
+
+def country_name(code: Optional[str], locale: str) -> Optional[str]:
+    """
+    Country name in the locale language, None when code or locale is unknown.
+
+    :param code: ISO 3166 alpha-2 country code, case-insensitive.
+    :param locale: request locale, eg. "ru" or "pt-BR".
+    """
+    if not code:
+        return None
+    return get_countries().get(language(locale), {}).get(code.upper())
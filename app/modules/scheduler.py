@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from pydantic import BaseModel, Field
+import system
+from modules import deadline
+from modules.deadline import DeadlineExceeded
+
+
+class SchedulerSettings(BaseModel, extra="allow"):
+    """
+    Admission of upstream LLM calls, configured in [genai.scheduler].
+
+    At most `capacity` calls per process are in flight. Waiting calls are
+    admitted weighted-fair by traffic class; classes in `preempt` are admitted
+    before any other waiting call, and the last `reserved` free slots are
+    kept for them.
+    """
+    enabled: bool = True
+    capacity: int = 32
+    reserved: int = 4
+    weights: Dict[str, float] = Field(default_factory=lambda: {"interactive": 8.0, "batch": 2.0, "refresh": 1.0})
+    preempt: List[str] = Field(default_factory=lambda: ["interactive"])
+
+
+# traffic class of upstream calls made in the current context, commands and refresh workers override it
+traffic: ContextVar[str] = ContextVar("traffic", default="interactive")
+
+
+@contextmanager
+def classified(name: str):
+    """Run the block as traffic class `name`."""
+    token = traffic.set(name)
+    try:
+        yield
+    finally:
+        traffic.reset(token)
+
+
+def on_loop() -> bool:
+    """Whether the current thread runs an event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class Ticket:
+    def __init__(self, name: str):
+        self.name = name
+        self.queued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+
+class Scheduler:
+    """
+    Weighted-fair admission of upstream calls per traffic class.
+
+    Every class has a FIFO queue and a virtual pass advanced by 1 / weight
+    per admitted call; among waiting classes the one with the lowest pass
+    goes next (stride scheduling), so backlogged classes share slots in
+    proportion to their weights while idle classes bank no credit.
+
+    :param settings: scheduler settings.
+    """
+    def __init__(self, settings: SchedulerSettings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.queues: Dict[str, Deque[Ticket]] = {}
+        self.passes: Dict[str, float] = {}
+        self.clock = 0.0
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def weight(self, name: str) -> float:
+        return self.settings.weights.get(name) or 1.0
+
+    def enqueue(self, ticket: Ticket):
+        with self.lock:
+            queue = self.queues.setdefault(ticket.name, deque())
+            if not queue:
+                # a class returning from idle starts at the current virtual time
+                self.passes[ticket.name] = max(self.passes.get(ticket.name, 0.0), self.clock)
+            queue.append(ticket)
+            self.dispatch()
+
+    def dispatch(self):
+        """Grant free slots to waiting tickets, lock must be held."""
+        while self.inflight < self.settings.capacity:
+            waiting = [name for name, queue in self.queues.items() if queue]
+            preempting = [name for name in waiting if name in self.settings.preempt]
+            if preempting:
+                waiting = preempting
+            elif self.settings.capacity - self.inflight <= self.settings.reserved:
+                return
+            if not waiting:
+                return
+            name = min(waiting, key=lambda current: self.passes[current])
+            self.clock = self.passes[name]
+            self.passes[name] += 1.0 / self.weight(name)
+            self.grant(self.queues[name].popleft())
+
+    def grant(self, ticket: Ticket):
+        self.inflight += 1
+        ticket.granted = True
+        waited = time.monotonic() - ticket.queued
+        stats = self.stats.setdefault(ticket.name, {
+            "admitted": 0, "inflight": 0, "waitSeconds": 0.0, "waitMax": 0.0, "samples": deque(maxlen=1000)})
+        stats["admitted"] += 1
+        stats["inflight"] += 1
+        stats["waitSeconds"] += waited
+        stats["waitMax"] = max(stats["waitMax"], waited)
+        stats["samples"].append(waited)
+        ticket.event.set()
+        if ticket.future is not None:
+            ticket.loop.call_soon_threadsafe(lambda: ticket.future.done() or ticket.future.set_result(None))
+
+    def release(self, ticket: Ticket):
+        with self.lock:
+            if ticket.granted:
+                self.inflight -= 1
+                self.stats[ticket.name]["inflight"] -= 1
+            else:
+                # abandoned while waiting
+                self.queues[ticket.name].remove(ticket)
+            self.dispatch()
+
+    @contextmanager
+    def slot(self):
+        """Hold a call slot of the current traffic class, waits at most until the request deadline.
+
+        Blocking the event loop thread would also block the releases of
+        `aslot` holders, so a sync call made there is admitted at once.
+        """
+        ticket = Ticket(traffic.get())
+        if on_loop():
+            system.logger.warning("sync genai call on the event loop thread, admitted without queueing")
+            with self.lock:
+                self.grant(ticket)
+        else:
+            self.enqueue(ticket)
+        try:
+            if not ticket.event.wait(deadline.timeout()):
+                with self.lock:
+                    if not ticket.granted:
+                        raise DeadlineExceeded("request deadline exceeded while queued for an upstream call")
+            yield
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Async `slot`, cancellation while queued gives the place up."""
+        ticket = Ticket(traffic.get())
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        self.enqueue(ticket)
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), deadline.timeout())
+            except asyncio.TimeoutError as e:
+                raise DeadlineExceeded("request deadline exceeded while queued for an upstream call") from e
+            yield
+        finally:
+            self.release(ticket)
+
+    def report(self) -> Dict[str, Any]:
+        """Queue time, waiting and in-flight calls per traffic class."""
+        with self.lock:
+            classes = {}
+            for name, stats in self.stats.items():
+                samples = sorted(stats["samples"])
+                classes[name] = {
+                    "admitted": stats["admitted"],
+                    "inflight": stats["inflight"],
+                    "waiting": len(self.queues.get(name) or ()),
+                    "waitAvg": stats["waitSeconds"] / stats["admitted"],
+                    "waitMax": stats["waitMax"],
+                    "waitP50": samples[len(samples) // 2] if samples else None,
+                    "waitP99": samples[min(int(len(samples) * 0.99), len(samples) - 1)] if samples else None,
+                }
+            return {"capacity": self.settings.capacity, "inflight": self.inflight, "classes": classes}
+
+
+class ScheduledModels:
+    """`client.models` replacement admitting calls through a scheduler.
+
+    :param models: models of the real client.
+    :param scheduler: scheduler.
+    """
+    def __init__(self, models, scheduler: Scheduler):
+        self.models = models
+        self.scheduler = scheduler
+
+    def generate_content(self, **request) -> Any:
+        with self.scheduler.slot():
+            return self.models.generate_content(**request)
+
+    def embed_content(self, **request) -> Any:
+        with self.scheduler.slot():
+            return self.models.embed_content(**request)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.models, name)
+
+
+class AsyncScheduledModels:
+    """`client.aio.models` replacement admitting calls through a scheduler.
+
+    :param models: async models of the real client.
+    :param scheduler: scheduler.
+    """
+    def __init__(self, models, scheduler: Scheduler):
+        self.models = models
+        self.scheduler = scheduler
+
+    async def generate_content(self, **request) -> Any:
+        async with self.scheduler.aslot():
+            return await self.models.generate_content(**request)
+
+    async def generate_content_stream(self, **request) -> AsyncIterator[Any]:
+        """The slot is held until the stream is exhausted or closed."""
+        slot = self.scheduler.aslot()
+        await slot.__aenter__()
+        try:
+            stream = await self.models.generate_content_stream(**request)
+        except BaseException:
+            await slot.__aexit__(None, None, None)
+            raise
+
+        async def scheduled():
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await slot.__aexit__(None, None, None)
+        return scheduled()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.models, name)
+
+
+class ScheduledClient:
+    """Genai client wrapper admitting `models` and `aio.models` calls through a scheduler.
+
+    :param client: real (or cassette) client.
+    :param scheduler: scheduler.
+    """
+    def __init__(self, client, scheduler: Scheduler):
+        self.client = client
+        self.models = ScheduledModels(client.models, scheduler)
+        self.aio = SimpleNamespace(models=AsyncScheduledModels(client.aio.models, scheduler))
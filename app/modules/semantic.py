@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy
+from pydantic import BaseModel
+
+
+class SemanticSettings(BaseModel, extra="allow"):
+    enabled: bool = False
+    embedder: str = "vertex"
+    model: str = "text-embedding-005"
+    dimensions: int = 256
+    threshold: float = 0.92
+    size: int = 10000
+    drift_sample: float = 0.02
+
+
+def normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class HashingEmbedder:
+    """Local CPU-only embedder: signed feature hashing of words and character trigrams.
+
+    Paraphrases sharing word stems land close, which is enough for tests and
+    for running without Vertex; real paraphrase matching needs the vertex embedder.
+
+    :param dimensions: vector size.
+    """
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def __call__(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        words = "".join(char if char.isalnum() else " " for char in text.lower()).split()
+        features = words + [f" {word} "[i:i + 3] for word in words for i in range(len(word))]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return normalize(vector)
+
+
+class VectorIndex:
+    """In-memory brute force cosine index with FIFO eviction.
+
+    Vectors are normalized, so cosine similarity is a dot product and the
+    scan is a single matrix-vector product. Rows are preallocated and written
+    in place: a new key takes the next free row, or the row of the oldest key
+    once the index is full, so inserts never rebuild the matrix.
+
+    :param size: maximum number of vectors.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.rows: "OrderedDict[str, int]" = OrderedDict()
+        self.values: List[Any] = []
+        self.matrix: Optional[numpy.ndarray] = None
+
+    def add(self, key: str, vector: List[float], value: Any):
+        if self.matrix is None:
+            self.matrix = numpy.zeros((self.size, len(vector)), dtype=numpy.float32)
+        if key in self.rows:
+            row = self.rows[key]
+            self.rows.move_to_end(key)
+        elif len(self.rows) < self.size:
+            row = len(self.rows)
+            self.values.append(None)
+        else:
+            _, row = self.rows.popitem(last=False)
+        self.rows[key] = row
+        self.matrix[row] = vector
+        self.values[row] = value
+
+    def search(self, vector: List[float]) -> Tuple[float, Any]:
+        """Find most similar entry, returns (similarity, value), (-1, None) when empty."""
+        if not self.rows:
+            return -1.0, None
+        scores = self.matrix[:len(self.rows)] @ numpy.asarray(vector, dtype=numpy.float32)
+        best = int(scores.argmax())
+        return float(scores[best]), self.values[best]
+
+
+class SemanticCache:
+    """Reuse extraction results of texts similar to an already extracted one in the same locale.
+
+    Hits are reported with their similarity; a small sample of hits is
+    still sent to the LLM (`verify`) so accuracy drift of reuse stays measurable.
+
+    :param settings: semantic cache settings.
+    :param embed: text to vector function.
+    """
+    def __init__(self, settings: SemanticSettings, embed: Callable[[str], List[float]]):
+        self.settings = settings
+        self.embed = embed
+        self.indexes: Dict[str, VectorIndex] = {}
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "verified": 0, "agreed": 0, "similarity": [0] * 20}
+
+    def get(self, text: str, locale: str) -> Tuple[Optional[Any], List[float], float]:
+        """Look up similar text, returns (value or None, vector of text, similarity).
+
+        :param text: user text.
+        :param locale: locale, texts are matched within the same locale only.
+        """
+        vector = self.embed(text.strip())
+        with self.lock:
+            index = self.indexes.get(locale)
+            similarity, value = index.search(vector) if index else (-1.0, None)
+            self.stats["lookups"] += 1
+            if similarity >= 0:
+                self.stats["similarity"][min(int(similarity * 20), 19)] += 1
+            if similarity < self.settings.threshold:
+                return None, vector, similarity
+            self.stats["hits"] += 1
+        return value, vector, similarity
+
+    def set(self, text: str, locale: str, vector: List[float], value: Any):
+        """Store value for text.
+
+        :param text: user text.
+        :param locale: locale.
+        :param vector: embedding of text as returned by `get`.
+        :param value: JSON serializable value.
+        """
+        with self.lock:
+            index = self.indexes.setdefault(locale, VectorIndex(self.settings.size))
+            index.add(text.strip(), vector, value)
+
+    def verify(self) -> bool:
+        """Whether this hit should be verified with the LLM to measure drift."""
+        return random.random() < self.settings.drift_sample
+
+    def compare(self, reused: Any, fresh: Any):
+        """Account verified hit, `reused` and `fresh` are values for the same text."""
+        with self.lock:
+            self.stats["verified"] += 1
+            self.stats["agreed"] += reused == fresh
+
+    def report(self) -> Dict[str, Any]:
+        """Hit rate, similarity distribution of lookups and agreement of verified hits."""
+        with self.lock:
+            stats = {**self.stats, "similarity": list(self.stats["similarity"])}
+        return {
+            "lookups": stats["lookups"],
+            "hits": stats["hits"],
+            "hitRate": stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0,
+            "entries": {locale: len(index.rows) for locale, index in self.indexes.items()},
+            "similarity": {
+                f"{bucket / 20:.2f}": count for bucket, count in enumerate(stats["similarity"]) if count},
+            "verified": stats["verified"],
+            "agreement": stats["agreed"] / stats["verified"] if stats["verified"] else None,
+        }
@@ -2,10 +2,12 @@
 import os
 import logging
 import functools
+from contextlib import asynccontextmanager, AsyncExitStack
 from typing import Sequence, List, Optional
 from pydantic import BaseModel, Field
 from loguru import logger
 from fastapi import Header
+from fastapi.responses import Response, ORJSONResponse as DefaultResponse
 from fastapi.openapi.utils import get_openapi
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 import system
@@ -112,6 +114,21 @@ def setup_options(app, debug=False):
             setup_options(route, debug)
 
 
+def setup_lifespan(hooks):
+    """Compose lifespan hooks into a single app lifespan.
+
+    :param hooks: list of async context manager factories, each called with app.
+    """
+    @asynccontextmanager
+    async def lifespan(app):
+        async with AsyncExitStack() as stack:
+            for hook in hooks:
+                await stack.enter_async_context(hook(app))
+            yield
+
+    return lifespan
+
+
 def openapi(app, description):
     """ openapi callback """
     if app.openapi_schema:
@@ -168,6 +185,15 @@ def headers(
     return metadata
 
 
+def validated(model: BaseModel, status_code: int = 200):
+    """Serialize already validated model as is, skipping response_model re-validation.
+
+    :param model: response model instance.
+    :param status_code: response status code.
+    """
+    return Response(model.model_dump_json(), status_code=status_code, media_type="application/json")
+
+
 def responses(*args: List[int]):
     """Common responses definitions."""
     definitions = {
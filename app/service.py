@@ -10,11 +10,14 @@ from fastapi.middleware.cors import CORSMiddleware
 import system
 from modules.system.click import setup_click
 from modules.system.fastapi import setup_logging
-from modules.system.fastapi import setup_options, setup_openapi
-from modules.system.fastapi import ServiceSettings, CORSSettings
+from modules.system.fastapi import setup_options, setup_openapi, setup_lifespan
+from modules.system.fastapi import ServiceSettings, CORSSettings, DefaultResponse
 from modules.system.security import SecuritySettings
 from modules.system.security import GuardMiddleware
-from middlewares import MetadataMiddleware
+from middlewares import MetadataMiddleware, DeadlineMiddleware, AdmissionMiddleware, deadline_exceeded
+from modules.deadline import DeadlineExceeded
+import modules.genai as genai
+import modules.database.module as database
 import handlers
 
 setup_click({
@@ -69,11 +72,13 @@ else:
     app = FastAPI(
         title=system.project.name,
         version=system.project.version,
-        docs_url=None, redoc_url=None, openapi_url=None
+        docs_url=None, redoc_url=None, openapi_url=None,
+        lifespan=setup_lifespan([database.lifespan, genai.lifespan])
     )
     api = FastAPI(
         title=system.project.name,
-        version=system.project.version
+        version=system.project.version,
+        default_response_class=DefaultResponse
     )
     api.name = "api"
     api.default = "/redoc"
@@ -107,11 +112,15 @@ else:
     setup_options(app, debug=settings.debug)
     setup_openapi(registry.values())
     app.add_middleware(MetadataMiddleware)
+    # inside the deadline, time spent queued counts against it
+    app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(DeadlineMiddleware)
     configured = set()
     cors = CORSSettings(**getattr(system.settings, "cors", {}))
     security = SecuritySettings(**getattr(system.settings, "security", {}))
     for name, subapp in registry.items():
 
+        subapp.add_exception_handler(DeadlineExceeded, deadline_exceeded)
         current = getattr(security, name, None)
         if current:
             if "active" in current and current["active"]:
@@ -7,6 +7,7 @@ class Locations(BaseModel):
     base: str = "{root}/var"
     logs: str = "{root}/var/logs"
     temp: str = "{root}/var/temp"
+    cache: str = "{root}/var/cache"
     static: str = "{root}/app/static"
     templates: str = "{root}/app/templates"
 